@@ -1,12 +1,20 @@
 import os
-import re
-import pandas as pd
-import pdfplumber
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, Response, render_template, request, jsonify, send_file, send_from_directory
 from werkzeug.utils import secure_filename
 import tempfile
-import shutil
-from zipfile import ZipFile
+from zipfile import ZipFile, is_zipfile
+from extraction import BatchStores, check_engine, process_zip
+from dedup import DedupIndex
+from extraction_cache import ExtractionCache
+from jobs import JobQueue
+from ledger import Ledger, certificate_key, parse_quarter, quarter_label
+from manifest import QuarterManifest
+from metrics import Metrics, add_timings
+from profiling import PROFILE_ALL, slowest_files
+from quarantine import Quarantine
+from outputs import FORMATS, UnsupportedFormat, check_format, convert, open_writer, output_filename, split_filename
+from validatecsv import ReportWriter, validate_record
+from workspaces import WorkspaceManager, WorkspaceQuotaExceeded
 
 # Initialize Flask app
 app = Flask(__name__, template_folder='templates')
@@ -21,81 +29,47 @@ app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max
 
-def extract_pan_from_filename(filename):
-    pan_pattern = r"[A-Z]{5}[0-9]{4}[A-Z]"
-    match = re.search(pan_pattern, filename)
-    return match.group(0) if match else None
+# Base name of a job's downloads when its quarter label gives none
+DEFAULT_STEM = 'tds_data_output'
 
-def extract_total_amount_paid(text):
-    total_pattern = r"Summary of payment[\s\S]*?Total \(Rs\.\)\s+([\d,]+\.\d{2})"
-    match = re.search(total_pattern, text)
-    if match:
-        return float(match.group(1).replace(',', ''))
-    return None
+# Results of earlier runs, keyed by PDF content, so re-uploaded certificates skip parsing
+extraction_cache = ExtractionCache(os.path.join(OUTPUT_FOLDER, 'extraction_cache.sqlite3'))
 
-def extract_total_tds(text):
-    tds_pattern = r"Q1\s+\w+\s+([\d,]+\.\d{2})\s+([\d,]+\.\d{2})"
-    match = re.search(tds_pattern, text)
-    if match:
-        return float(match.group(1).replace(',', ''))
-    
-    backup_pattern = r"Total \(Rs\.\)\s+([\d,]+\.\d{2})"
-    matches = re.finditer(backup_pattern, text)
-    total = None
-    for i, m in enumerate(matches):
-        if i == 1:
-            total = float(m.group(1).replace(',', ''))
-            break
-    return total
-
-def process_pdf(pdf_path, deal_name):
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = "".join(page.extract_text() + "\n" for page in pdf.pages if page.extract_text())
-            
-            total_paid = extract_total_amount_paid(text)
-            total_tds = extract_total_tds(text)
-            
-            pan = extract_pan_from_filename(os.path.basename(pdf_path))
-            
-            return {
-                "PAN of deductee": pan,
-                "Total Amount paid": total_paid,
-                "Total TDS": total_tds,
-                "Name of deal": deal_name
-            }
-    except Exception as e:
-        print(f"Error processing {pdf_path}: {str(e)}")
-        return None
+# /process runs in the background; any worker can answer /jobs/<id> from this store
+job_queue = JobQueue(os.path.join(OUTPUT_FOLDER, 'jobs.sqlite3'))
 
-def process_directory(base_dir):
-    data = []
-    processed_count = 0
-    errors = []
-    
-    # Find all PDF files in any subdirectory structure
-    for root, dirs, files in os.walk(base_dir):
-        # Check if this is a deal directory (has PDF files)
-        pdf_files = [f for f in files if f.lower().endswith('.pdf')]
-        
-        if pdf_files:
-            # Use the parent directory name as the deal name
-            deal_name = os.path.basename(root)
-            
-            for filename in pdf_files:
-                pdf_path = os.path.join(root, filename)
-                try:
-                    result = process_pdf(pdf_path, deal_name)
-                    if result:
-                        data.append(result)
-                        processed_count += 1
-                        print(f"Processed: {deal_name}/{filename}")
-                    else:
-                        errors.append(f"Could not extract data from {deal_name}/{filename}")
-                except Exception as e:
-                    errors.append(f"Error processing {deal_name}/{filename}: {str(e)}")
-    
-    return data, processed_count, errors
+# Stage timings and file counts of every job, summed across workers for /metrics
+metrics = Metrics(os.path.join(OUTPUT_FOLDER, 'metrics.sqlite3'))
+
+# Every quarter's rows in one indexed store, for totals across quarters and years
+ledger = Ledger(os.path.join(OUTPUT_FOLDER, 'ledger.sqlite3'))
+
+# Certificates that keep timing out or crashing a worker are skipped after a few tries
+quarantine = Quarantine(os.path.join(OUTPUT_FOLDER, 'quarantine.sqlite3'))
+
+# Certificates seen in any upload, so a copy filed under another deal is caught in later ones too
+DEDUP_FILE = os.path.join(OUTPUT_FOLDER, 'dedup.sqlite3')
+
+# Every upload gets a private workspace under UPLOAD_FOLDER, so concurrent
+# users never clobber each other; idle ones are reclaimed in the background
+workspaces = WorkspaceManager(UPLOAD_FOLDER)
+
+@app.before_request
+def start_janitor():
+    # Started by a worker's first request rather than at import: with
+    # gunicorn's preload_app the import happens in the master, and threads
+    # started there are not carried into the forked workers
+    workspaces.start_janitor()
+
+def find_uploaded_zip(workspace_id):
+    """Path of the archive saved into a workspace by /upload, if any."""
+    if workspaces.path(workspace_id) is None:
+        return None
+    upload_dir = workspaces.upload_dir(workspace_id)
+    for f in sorted(os.listdir(upload_dir)):
+        if f.endswith('.zip'):
+            return os.path.join(upload_dir, f)
+    return None
 
 @app.route('/')
 def index():
@@ -112,87 +86,304 @@ def upload_files():
         return jsonify({"error": "No selected file"}), 400
     
     if file and file.filename.endswith('.zip'):
-        # Clear previous uploads
-        for f in os.listdir(app.config['UPLOAD_FOLDER']):
-            path = os.path.join(app.config['UPLOAD_FOLDER'], f)
-            if os.path.isdir(path):
-                shutil.rmtree(path)
-            else:
-                os.remove(path)
+        try:
+            workspace_id = workspaces.create(request.content_length or 0)
+        except WorkspaceQuotaExceeded as e:
+            return jsonify({"error": str(e)}), 507
         
-        # Create temp file for the zip
-        _, temp_path = tempfile.mkstemp()
-        file.save(temp_path)
+        # Keep the archive as uploaded; /process reads the PDFs straight out of it
+        zip_path = os.path.join(workspaces.upload_dir(workspace_id), secure_filename(file.filename) or 'upload.zip')
+        file.save(zip_path)
         
-        # Extract the zip
-        with ZipFile(temp_path, 'r') as zip_ref:
-            zip_ref.extractall(app.config['UPLOAD_FOLDER'])
+        if not is_zipfile(zip_path):
+            workspaces.delete(workspace_id)
+            return jsonify({"error": "The uploaded file is not a valid ZIP archive"}), 400
         
-        # Remove the temp file
-        os.remove(temp_path)
-        
-        return jsonify({"message": "Uploaded and extracted successfully"}), 200
+        return jsonify({"message": "Uploaded successfully", "workspace": workspace_id}), 200
     
     return jsonify({"error": "Invalid file format, please upload a ZIP file"}), 400
 
 @app.route('/process', methods=['POST'])
 def process_files():
     quarter = request.form.get('quarter', 'Unknown Quarter')
+    workspace_id = request.form.get('workspace')
+    output_format = request.form.get('format', 'csv')
+    incremental = request.form.get('incremental') in ('1', 'true', 'on')
+    timings = request.form.get('timings') in ('1', 'true', 'on')
+    profile = PROFILE_ALL or request.form.get('profile') in ('1', 'true', 'on')
     
-    data, processed_count, errors = process_directory(app.config['UPLOAD_FOLDER'])
+    try:
+        check_format(output_format)
+        engine = check_engine(request.form.get('engine'))
+    except (UnsupportedFormat, ValueError) as e:
+        return jsonify({"success": False, "message": str(e), "errors": None}), 400
     
-    if data:
-        df = pd.DataFrame(data)
-        output_filename = f"{quarter}.csv"
-        output_path = os.path.join(app.config['OUTPUT_FOLDER'], output_filename)
-        df.to_csv(output_path, index=False)
-        
+    zip_path = find_uploaded_zip(workspace_id)
+    if zip_path is None:
         return jsonify({
+            "success": False,
+            "message": "No upload found. Please upload a ZIP file first.",
+            "errors": None
+        }), 400
+    
+    workspaces.touch(workspace_id)
+    job_id = job_queue.submit(run_extraction, workspace_id, zip_path, quarter, output_format, incremental,
+                              engine, timings, profile, kind='process')
+    
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}"
+    }), 202
+
+def run_extraction(progress, workspace_id, zip_path, quarter, output_format='csv', incremental=False,
+                   engine=None, timings=False, profile=False):
+    """Background body of a /process job; returns the job's result.
+
+    With ``timings`` the result breaks the job's time down by stage, in
+    total and per file. With ``profile`` the slowest files are profiled
+    into the workspace and listed under "slowest".
+    """
+    file_stats = []
+    output_dir = workspaces.output_dir(workspace_id)
+    # A quarter with nothing usable in a file name still needs a base name
+    stem = secure_filename(quarter) or DEFAULT_STEM
+    manifest = None
+    if incremental:
+        # One manifest per quarter: certificates unchanged since the last
+        # upload for this quarter reuse their rows without being opened
+        manifest = QuarterManifest(os.path.join(OUTPUT_FOLDER, 'manifests', f"{stem}.sqlite3"), quarter, engine)
+    filename = output_filename(stem, output_format)
+    output_path = os.path.join(output_dir, filename)
+    report_filename = f"{stem}_validation.csv"
+    report_path = os.path.join(output_dir, report_filename)
+    
+    # Rows go into the ledger only under a quarter it can read
+    try:
+        ledger_rows = ledger.writer(quarter)
+        ledger_result = {"quarter": quarter_label(*parse_quarter(quarter))}
+    except ValueError as e:
+        ledger_rows = None
+        ledger_result = {"error": f"Not added to the ledger: {str(e)}"}
+    # The same PAN and amounts only count as a duplicate within one quarter;
+    # without a quarter the ledger can read, only within this job
+    dedup = DedupIndex(DEDUP_FILE, scope=ledger_result.get("quarter"))
+    
+    # Rows go to the output file in row groups while the batch is running,
+    # and to the validation report and the ledger with them, so no job
+    # keeps its records in memory
+    with open_writer(output_path, output_format) as writer, ReportWriter(report_path) as report:
+        def on_record(record, stats):
+            report.write(record, stats)
+            if ledger_rows is None:
+                return
+            if stats.get("duplicate_of"):
+                # Already counted under the certificate it repeats
+                ledger_result["duplicates_skipped"] = ledger_result.get("duplicates_skipped", 0) + 1
+                return
+            ledger_rows.write(certificate_key(stats), record)
+        
+        try:
+            stores = BatchStores(cache=extraction_cache, manifest=manifest, quarantine=quarantine,
+                                 dedup=dedup, metrics=metrics)
+            _, processed_count, errors = process_zip(
+                zip_path, stores=stores, quarter=quarter, file_stats=file_stats, progress=progress,
+                validate=validate_record, sink=writer, on_record=on_record, collect=False,
+                engine=engine, profile_dir=output_dir if profile else None
+            )
+        finally:
+            if ledger_rows is not None:
+                ledger_rows.close()
+                ledger_result["rows"] = ledger_rows.rows
+        # Skipped copies have no row; the report names them and their original
+        for stats in file_stats:
+            if stats.get("copy_of"):
+                report.write_copy(stats)
+    
+    job_timings = {}
+    for stats in file_stats:
+        if timings:
+            add_timings(job_timings, stats.get("timings"))
+            stats["timings"] = {stage: round(seconds, 4) for stage, seconds in stats.get("timings", {}).items()}
+        else:
+            stats.pop("timings", None)
+    workspaces.touch(workspace_id)
+    copies = [{"file": stats["file"], "copy_of": stats["copy_of"]} for stats in file_stats if stats.get("copy_of")]
+    
+    if processed_count:
+        slowest = None
+        if profile:
+            slowest = slowest_files(file_stats)
+            for entry in slowest:
+                entry["profile_url"] = f"/download/{workspace_id}/{entry['profile']}" if entry["profile"] else None
+        
+        return {
             "success": True,
             "message": f"Processed {processed_count} files successfully",
-            "filename": output_filename,
+            "filename": filename,
+            "format": output_format,
+            "download_url": f"/download/{workspace_id}/{filename}",
             "count": processed_count,
-            "errors": errors if errors else None
-        }), 200
+            "pages_parsed": sum(stats["pages_parsed"] for stats in file_stats),
+            "unchanged": sum(1 for stats in file_stats if stats.get("unchanged")),
+            "copies_skipped": copies,
+            "duplicates": sum(1 for stats in file_stats if stats.get("duplicate_of")),
+            "engine": engine,
+            "fallbacks": sum(1 for stats in file_stats if stats.get("engine", engine) != engine),
+            "templated": sum(1 for stats in file_stats if stats.get("layout")),
+            "reread": sum(1 for stats in file_stats if stats.get("reread")),
+            "timings": {stage: round(seconds, 4) for stage, seconds in job_timings.items()} if timings else None,
+            "slowest": slowest,
+            "failed": [stats["file"] for stats in file_stats if stats.get("failure")],
+            "quarantined": [stats["file"] for stats in file_stats if stats.get("quarantined")],
+            "ledger": ledger_result,
+            "files": file_stats,
+            "errors": errors if errors else None,
+            "validation": {
+                "valid": report.invalid_rows == 0,
+                "invalid_rows": report.invalid_rows,
+                "error_counts": report.error_counts,
+                "report_filename": report_filename,
+                "report_url": f"/download/{workspace_id}/{report_filename}"
+            }
+        }
     else:
-        return jsonify({
+        os.remove(output_path)
+        os.remove(report_path)
+        if copies and not errors:
+            return {
+                "success": False,
+                "message": "No new data: every certificate is a copy of one processed before.",
+                "errors": None,
+                "copies_skipped": copies
+            }
+        return {
             "success": False,
             "message": "No data was processed. Check if your files are in the correct format.",
-            "errors": errors if errors else ["No PDF files found with readable data"]
-        }), 400
+            "errors": errors if errors else ["No PDF files found with readable data"],
+            "copies_skipped": copies
+        }
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
 
-@app.route('/download/<filename>', methods=['GET'])
-def download_file(filename):
-    return send_file(
-        os.path.join(app.config['OUTPUT_FOLDER'], filename),
+@app.route('/download/<workspace_id>/<filename>', methods=['GET'])
+def download_file(workspace_id, filename):
+    if workspaces.path(workspace_id) is None:
+        return jsonify({"error": "This download has expired, please process the files again"}), 404
+    workspaces.touch(workspace_id)
+    
+    # ?format= converts a processed file into another format on request
+    output_format = request.args.get('format')
+    stem, stored_format = split_filename(filename)
+    if output_format and output_format != stored_format:
+        source_path = os.path.join(workspaces.output_dir(workspace_id), secure_filename(filename))
+        if not os.path.isfile(source_path):
+            return jsonify({"error": "File not found"}), 404
+        try:
+            check_format(output_format)
+        except UnsupportedFormat as e:
+            return jsonify({"error": str(e)}), 400
+        filename = secure_filename(output_filename(stem, output_format))
+        target_path = os.path.join(workspaces.output_dir(workspace_id), filename)
+        if not os.path.isfile(target_path) or os.path.getmtime(target_path) < os.path.getmtime(source_path):
+            try:
+                convert(source_path, target_path, output_format)
+            except UnsupportedFormat as e:
+                return jsonify({"error": str(e)}), 400
+    
+    # Anything else in the workspace (e.g. a profile) goes out as it is
+    stored_format = split_filename(filename)[1]
+    known = filename.endswith(FORMATS[stored_format].extension)
+    return send_from_directory(
+        workspaces.output_dir(workspace_id),
+        filename,
         as_attachment=True,
-        download_name=filename
+        download_name=filename,
+        mimetype=FORMATS[stored_format].mimetype if known else 'application/octet-stream'
     )
 
 @app.route('/debug', methods=['GET'])
 def debug_folder_structure():
     """Endpoint to help diagnose folder structure issues"""
     structure = []
+    zip_path = find_uploaded_zip(request.args.get('workspace'))
     
-    for root, dirs, files in os.walk(app.config['UPLOAD_FOLDER']):
-        level = root.replace(app.config['UPLOAD_FOLDER'], '').count(os.sep)
-        indent = ' ' * 4 * level
-        folder = os.path.basename(root)
-        structure.append(f"{indent}{folder}/")
-        
-        sub_indent = ' ' * 4 * (level + 1)
-        for f in files:
-            structure.append(f"{sub_indent}{f}")
+    if zip_path:
+        with ZipFile(zip_path) as zip_ref:
+            for name in sorted(zip_ref.namelist()):
+                parts = name.rstrip('/').split('/')
+                indent = ' ' * 4 * (len(parts) - 1)
+                structure.append(f"{indent}{parts[-1]}{'/' if name.endswith('/') else ''}")
     
     return jsonify({
-        "upload_folder": app.config['UPLOAD_FOLDER'],
+        "upload_folder": os.path.dirname(zip_path) if zip_path else app.config['UPLOAD_FOLDER'],
+        "zip": os.path.basename(zip_path) if zip_path else None,
         "structure": structure
     })
 
 @app.route('/health')
 def health_check():
     """Simple health check endpoint for cloud providers"""
-    return jsonify({"status": "healthy"})
+    return jsonify({"status": "healthy", "cache": extraction_cache.stats()})
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Extraction metrics for Prometheus to scrape"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/ledger/pans/<pan>')
+def ledger_pan(pan):
+    """Totals for one PAN across every quarter, or one fiscal year with ?year=2024-25"""
+    try:
+        return jsonify(ledger.pan_totals(pan, request.args.get('year')))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/ledger/deals/<deal>')
+def ledger_deal(deal):
+    """Totals for one deal across every quarter, or one fiscal year with ?year=2024-25"""
+    try:
+        return jsonify(ledger.deal_totals(deal, request.args.get('year')))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/ledger/quarters')
+def ledger_quarters():
+    return jsonify(ledger.quarters())
+
+@app.route('/ledger/export')
+def ledger_export():
+    """The ledger's rows for ?quarter= and/or ?year= (else all) as a download in ?format="""
+    quarter = request.args.get('quarter')
+    year = request.args.get('year')
+    output_format = request.args.get('format', 'csv')
+    try:
+        check_format(output_format)
+        records = ledger.records(quarter, year)
+    except (UnsupportedFormat, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    
+    filename = output_filename(secure_filename(quarter or year or '') or 'ledger', output_format)
+    handle, path = tempfile.mkstemp(suffix=FORMATS[output_format].extension, dir=OUTPUT_FOLDER)
+    os.close(handle)
+    with open_writer(path, output_format) as writer:
+        for record in records:
+            writer.write(record)
+    # Unlinked at once; the open handle keeps it readable until it is sent
+    export_file = open(path, 'rb')
+    os.remove(path)
+    return send_file(export_file, as_attachment=True, download_name=filename,
+                     mimetype=FORMATS[output_format].mimetype)
+
+@app.route('/quarantine')
+def quarantine_list():
+    """Certificates that timed out or crashed a worker, and whether they are now skipped"""
+    return jsonify(quarantine.entries())
 
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
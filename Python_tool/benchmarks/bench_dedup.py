@@ -0,0 +1,61 @@
+"""Memory and speed of a DedupIndex over hundreds of thousands of certificates.
+
+Adds --entries certificates (a content hash and a record each) to one
+index, every tenth a copy of an earlier one, and reports the memory the
+index took and the time per lookup. With --persist the index is backed
+by a SQLite file, as the apps keep it across uploads, and the final flush
+is timed with the lookups. Run from the Python_tool directory:
+
+    python -m benchmarks.bench_dedup --entries 300000 [--persist]
+"""
+import argparse
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.corpus import random_pan
+from dedup import DedupIndex
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=300000)
+    parser.add_argument('--persist', action='store_true', help="back the index with a SQLite file")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    certificates = []
+    for number in range(args.entries):
+        if number % 10 == 9:
+            certificates.append(rng.choice(certificates))
+            continue
+        paid = round(rng.uniform(10000, 5000000), 2)
+        record = {"PAN of deductee": random_pan(rng), "Total Amount paid": paid, "Total TDS": round(paid * 0.1, 2)}
+        certificates.append((hashlib.sha256(str(number).encode()).hexdigest(), record))
+    labels = [f"Deal {number % 500:03d}/certificate_{number}.pdf" for number in range(args.entries)]
+
+    work_dir = tempfile.mkdtemp(prefix='tds-dedup-')
+    try:
+        tracemalloc.start()
+        index = DedupIndex(os.path.join(work_dir, 'dedup.sqlite3') if args.persist else None)
+        start = time.perf_counter()
+        copies = duplicates = 0
+        for (digest, record), label in zip(certificates, labels):
+            copies += index.first_copy(digest, label) is not None
+            duplicates += index.first_record(record, '3', label) is not None
+        index.flush()
+        seconds = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"{args.entries} certificates: {copies} copies, {duplicates} duplicate records")
+    print(f"index memory {memory / 2**20:.1f} MB ({memory / len(index):.0f} bytes per key), "
+          f"{seconds / args.entries * 1e6:.1f} us per certificate")
+
+if __name__ == '__main__':
+    main()
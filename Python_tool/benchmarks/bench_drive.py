@@ -0,0 +1,55 @@
+"""Drive ingestion against a fake Drive client with simulated latency.
+
+Compares one download at a time with the thread pool, then re-runs the
+sync to show unchanged files being skipped. "connections" is how many
+the client has opened so far, one per downloading thread. Run from the
+Python_tool directory:
+
+    python -m benchmarks.bench_drive --files 100 --latency 0.05
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.fake_drive import FakeDriveClient
+from drive_ingest import DriveSync
+
+def sync(client, target, workers):
+    start = time.perf_counter()
+    drive_sync = DriveSync(client, '', target, workers=workers)
+    tasks = drive_sync.run()
+    return time.perf_counter() - start, drive_sync, tasks
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    drive_dir = tempfile.mkdtemp(prefix='tds-drive-')
+    local_dir = tempfile.mkdtemp(prefix='tds-drive-local-')
+    try:
+        expected = generate_corpus(drive_dir, files=args.files)
+        client = FakeDriveClient(drive_dir, latency=args.latency, flaky={expected[0][0].rsplit('/', 1)[-1]})
+
+        print(f"{'run':>12} {'workers':>8} {'seconds':>9} {'downloaded':>11} {'skipped':>8} {'errors':>7} "
+              f"{'connections':>12}")
+        for label, target, workers in (('serial', tempfile.mkdtemp(dir=local_dir), 1),
+                                       ('parallel', tempfile.mkdtemp(dir=local_dir), args.workers)):
+            elapsed, drive_sync, tasks = sync(client, target, workers)
+            assert len(tasks) == args.files, drive_sync.errors
+            print(f"{label:>12} {workers:>8} {elapsed:>9.2f} {drive_sync.downloaded:>11} "
+                  f"{drive_sync.skipped:>8} {len(drive_sync.errors):>7} {client.connections:>12}")
+
+        elapsed, drive_sync, tasks = sync(client, target, args.workers)
+        print(f"{'unchanged':>12} {args.workers:>8} {elapsed:>9.2f} {drive_sync.downloaded:>11} "
+              f"{drive_sync.skipped:>8} {len(drive_sync.errors):>7} {client.connections:>12}")
+    finally:
+        shutil.rmtree(drive_dir, ignore_errors=True)
+        shutil.rmtree(local_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Per-page latency and field accuracy of each text engine.
+
+Every engine reads the whole of every certificate (no early exit) so the
+latency is per page of text extracted; accuracy is checked against the
+values the corpus was generated with. Run from the Python_tool directory:
+
+    python -m benchmarks.bench_engines --files 100 --pages 1 3 10
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+from benchmarks.corpus import generate_corpus
+from extraction import TEXT_ENGINES, process_pdf
+
+FIELDS = ("Total Amount paid", "Total TDS")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=100)
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 3, 10],
+                        help="certificate lengths to measure")
+    args = parser.parse_args()
+
+    print(f"{'pages':>6} {'engine':>11} {'ms/page':>8} {'ms/file':>8} {'correct':>8} {'fallback':>9}")
+    for pages in args.pages:
+        corpus_dir = tempfile.mkdtemp(prefix='tds-corpus-')
+        try:
+            written = generate_corpus(corpus_dir, files=args.files, page_counts=(pages,))
+            for engine in TEXT_ENGINES:
+                correct = 0
+                fallbacks = 0
+                pages_parsed = 0
+                start = time.perf_counter()
+                for path, expected in written:
+                    stats = {}
+                    record = process_pdf(path, expected["Name of deal"], early_exit=False,
+                                         stats=stats, quarter='Q3', engine=engine)
+                    pages_parsed += stats['pages_parsed']
+                    fallbacks += stats['engine'] != engine
+                    correct += all(record[field] == expected[field] for field in FIELDS)
+                elapsed = time.perf_counter() - start
+                print(f"{pages:>6} {engine:>11} {elapsed / pages_parsed * 1000:>8.2f} "
+                      f"{elapsed / len(written) * 1000:>8.2f} {correct:>4}/{len(written):<3} {fallbacks:>9}")
+        finally:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
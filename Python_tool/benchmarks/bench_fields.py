@@ -0,0 +1,64 @@
+"""Per-document cost of field extraction on synthetic certificate text.
+
+Compares the single-scan field spec with the per-field regex helpers it
+replaced. Run from the Python_tool directory:
+
+    python -m benchmarks.bench_fields --docs 500 --pages 1 3 20 100
+"""
+import argparse
+import random
+import re
+import timeit
+
+from benchmarks.corpus import certificate_pages, random_pan
+from fields import extract_fields
+
+def legacy_extract(text):
+    """The regex helpers as they were before fields.py, for comparison."""
+    total_paid = None
+    match = re.search(r"Summary of payment[\s\S]*?Total \(Rs\.\)\s+([\d,]+\.\d{2})", text)
+    if match:
+        total_paid = float(match.group(1).replace(',', ''))
+
+    total_tds = None
+    match = re.search(r"Q1\s+\w+\s+([\d,]+\.\d{2})\s+([\d,]+\.\d{2})", text)
+    if match:
+        total_tds = float(match.group(1).replace(',', ''))
+    else:
+        for i, m in enumerate(re.finditer(r"Total \(Rs\.\)\s+([\d,]+\.\d{2})", text)):
+            if i == 1:
+                total_tds = float(m.group(1).replace(',', ''))
+                break
+    return {"Total Amount paid": total_paid, "Total TDS": total_tds}
+
+def make_documents(count, page_counts=(1, 2, 3), seed=0):
+    rng = random.Random(seed)
+    docs = []
+    for _ in range(count):
+        total_paid = round(rng.uniform(10000, 5000000), 2)
+        pages = certificate_pages(random_pan(rng), rng.choice(['Q1', 'Q2', 'Q3', 'Q4']),
+                                  total_paid, round(total_paid * 0.1, 2), rng.choice(page_counts), rng)
+        docs.append("".join("\n".join(lines) + "\n" for lines in pages))
+    return docs
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 3, 20, 100],
+                        help="certificate lengths to measure")
+    args = parser.parse_args()
+
+    print(f"{'pages':>6} {'legacy us/doc':>14} {'fields us/doc':>14} {'differ':>7}")
+    for pages in args.pages:
+        docs = make_documents(args.docs, page_counts=(pages,))
+        mismatches = sum(extract_fields(doc) != legacy_extract(doc) for doc in docs)
+        timings = []
+        for extract in (legacy_extract, extract_fields):
+            best = min(timeit.repeat(lambda: [extract(doc) for doc in docs],
+                                     number=1, repeat=args.repeat))
+            timings.append(best / len(docs) * 1e6)
+        print(f"{pages:>6} {timings[0]:>14.1f} {timings[1]:>14.1f} {mismatches:>7}")
+
+if __name__ == '__main__':
+    main()
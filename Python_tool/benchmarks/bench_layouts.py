@@ -0,0 +1,54 @@
+"""Full-text extraction against layout-template regions, per file.
+
+Learns a template from the first certificate of a synthetic corpus, then
+reads every certificate with pdfplumber twice: once with no templates
+stored (the full first page) and once with the learned one (its regions
+only). Run from the Python_tool directory:
+
+    python -m benchmarks.bench_layouts --files 200
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import layouts
+from benchmarks.corpus import generate_corpus
+from extraction import process_pdf
+
+FIELDS = ("Total Amount paid", "Total TDS")
+
+def run(written):
+    correct = 0
+    template_reads = 0
+    start = time.process_time()
+    for path, expected in written:
+        stats = {}
+        record = process_pdf(path, expected["Name of deal"], stats=stats, quarter='Q3', engine='pdfplumber')
+        template_reads += stats['layout'] is not None
+        correct += all(record[field] == expected[field] for field in FIELDS)
+    return time.process_time() - start, correct, template_reads
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=200)
+    args = parser.parse_args()
+
+    corpus_dir = tempfile.mkdtemp(prefix='tds-corpus-')
+    try:
+        written = generate_corpus(corpus_dir, files=args.files)
+        layouts.LAYOUTS_FILE = os.path.join(corpus_dir, 'layouts.json')
+
+        print(f"{'read':>10} {'cpu ms/file':>12} {'correct':>8} {'templated':>10}")
+        for label in ('full text', 'template'):
+            if label == 'template':
+                layouts.save_layout(layouts.learn_layout(written[0][0], 'synthetic'))
+            elapsed, correct, template_reads = run(written)
+            print(f"{label:>10} {elapsed / len(written) * 1000:>12.2f} "
+                  f"{correct:>4}/{len(written):<3} {template_reads:>10}")
+    finally:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
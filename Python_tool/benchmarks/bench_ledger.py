@@ -0,0 +1,86 @@
+"""Per-PAN and per-deal totals from the ledger against loading every quarter's CSV.
+
+Fills a ledger with --years fiscal years of four quarters each, every
+quarter --rows rows over a fixed pool of PANs and deals, and writes the
+same quarters out as CSVs the way /process used to leave them. Then times
+"total TDS for this PAN in one fiscal year" and "totals for this deal
+across all years" both ways. Run from the Python_tool directory:
+
+    python -m benchmarks.bench_ledger --years 5 --rows 20000
+"""
+import argparse
+import glob
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.corpus import random_pan
+from ledger import Ledger
+
+def pandas_totals(csv_dir, column, value, year=None):
+    pattern = f"FY {year} Q*.csv" if year else "*.csv"
+    frames = [pd.read_csv(path) for path in glob.glob(os.path.join(csv_dir, pattern))]
+    df = pd.concat(frames, ignore_index=True)
+    rows = df[df[column] == value]
+    return len(rows), rows["Total Amount paid"].sum(), rows["Total TDS"].sum()
+
+def best_of(func, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        times.append(time.perf_counter() - start)
+    return min(times), value
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=20000, help="rows per quarter")
+    parser.add_argument('--pans', type=int, default=5000)
+    parser.add_argument('--deals', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    pans = [random_pan(rng) for _ in range(args.pans)]
+    deals = [f"Deal {number:03d}" for number in range(1, args.deals + 1)]
+    work_dir = tempfile.mkdtemp(prefix='tds-ledger-')
+    try:
+        ledger = Ledger(os.path.join(work_dir, 'ledger.sqlite3'))
+        start = time.perf_counter()
+        for year in range(2024 - args.years + 1, 2025):
+            for quarter in range(1, 5):
+                label = f"FY {year}-{(year + 1) % 100:02d} Q{quarter}"
+                records = []
+                for number in range(args.rows):
+                    pan, deal = rng.choice(pans), rng.choice(deals)
+                    paid = round(rng.uniform(10000, 5000000), 2)
+                    records.append((f"{label}/{number}", {
+                        "PAN of deductee": pan, "Name of deal": deal,
+                        "Total Amount paid": paid, "Total TDS": round(paid * 0.1, 2),
+                        "Total Amount paid confidence": "high", "Total TDS confidence": "high"}))
+                ledger.append(records, label)
+                ledger.export(os.path.join(work_dir, label + '.csv'), quarter=label)
+        quarters = args.years * 4
+        print(f"{quarters} quarters, {quarters * args.rows} rows, loaded in {time.perf_counter() - start:.1f}s\n")
+
+        pan, deal = pans[0], deals[0]
+        year = "2024-25"
+        print(f"{'query':>24} {'ledger ms':>10} {'pandas ms':>10} {'same':>5}")
+        for name, column, value, query_year, lookup in (
+            ("PAN in one year", "PAN of deductee", pan, year, lambda: ledger.pan_totals(pan, year)),
+            ("deal across all years", "Name of deal", deal, None, lambda: ledger.deal_totals(deal)),
+        ):
+            ledger_seconds, totals = best_of(lookup)
+            pandas_seconds, (rows, paid, tds) = best_of(
+                lambda: pandas_totals(work_dir, column, value, query_year), repeat=1)
+            same = rows == totals["rows"] and abs(tds - (totals["tds"] or 0)) < 0.01 * max(rows, 1)
+            print(f"{name:>24} {ledger_seconds * 1000:>10.2f} {pandas_seconds * 1000:>10.1f} {str(same):>5}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Peak memory of reading one very long certificate, page after page.
+
+Writes a synthetic certificate of --pages pages and reads all of it (no
+early exit) in a fresh interpreter per variant, so each peak RSS is its
+own:
+
+    pages kept   pdfplumber with every page's objects left cached, as
+                 process_pdf used to read documents
+    pdfplumber   process_pdf, releasing each page once it is read
+    pdfium       process_pdf with the pdfium engine
+
+Exits non-zero if process_pdf with pdfplumber peaks above --max-rss MB,
+so it can guard against regressions. Run from the Python_tool directory:
+
+    python -m benchmarks.bench_memory --pages 500
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.corpus import certificate_pages, random_pan, write_pdf
+
+VARIANTS = ('pages kept', 'pdfplumber', 'pdfium')
+
+def read(variant, path):
+    start = time.perf_counter()
+    if variant == 'pages kept':
+        import pdfplumber
+
+        with pdfplumber.open(path) as pdf:
+            pages = sum(1 for page in pdf.pages if page.extract_text() is not None)
+        record = None
+    else:
+        from extraction import process_pdf
+
+        stats = {}
+        record = process_pdf(path, 'Deal 001', early_exit=False, stats=stats, engine=variant)
+        pages = stats['pages_parsed']
+    return {
+        "pages": pages,
+        "seconds": round(time.perf_counter() - start, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "record": record,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--max-rss', type=float, default=250,
+                        help="fail if process_pdf with pdfplumber peaks above this many MB")
+    parser.add_argument('--child', choices=VARIANTS, help=argparse.SUPPRESS)
+    parser.add_argument('--pdf', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(read(args.child, args.pdf)))
+        return
+
+    work_dir = tempfile.mkdtemp(prefix='tds-memory-')
+    try:
+        rng = random.Random(0)
+        pan = random_pan(rng)
+        path = os.path.join(work_dir, f"{pan}_Q3_2024-25.pdf")
+        write_pdf(path, certificate_pages(pan, 'Q3', 1500000.0, 150000.0, args.pages, rng))
+        print(f"{args.pages}-page certificate, {os.path.getsize(path) / 2**20:.1f} MB\n")
+
+        print(f"{'variant':>11} {'pages':>6} {'seconds':>8} {'peak MB':>8} {'correct':>8}")
+        results = {}
+        for variant in VARIANTS:
+            output = subprocess.run([sys.executable, '-m', 'benchmarks.bench_memory', '--child', variant,
+                                     '--pdf', path], check=True, capture_output=True, text=True).stdout
+            result = results[variant] = json.loads(output.strip().splitlines()[-1])
+            record = result['record']
+            correct = '-' if record is None else str(
+                record['Total Amount paid'] == 1500000.0 and record['Total TDS'] == 150000.0)
+            print(f"{variant:>11} {result['pages']:>6} {result['seconds']:>8.2f} "
+                  f"{result['peak_rss_mb']:>8.1f} {correct:>8}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if results['pdfplumber']['peak_rss_mb'] > args.max_rss:
+        print(f"\nprocess_pdf peaked at {results['pdfplumber']['peak_rss_mb']} MB, over --max-rss {args.max_rss:g}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+"""Throughput of process_directory from one worker up to every core.
+
+Run from the Python_tool directory:
+
+    python -m benchmarks.bench_parallel --files 300
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.corpus import generate_corpus
+from extraction import process_directory
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    corpus_dir = tempfile.mkdtemp(prefix='tds-corpus-')
+    try:
+        generate_corpus(corpus_dir, files=args.files)
+
+        worker_counts = sorted({1, 2, 4, 8, 16, args.max_workers})
+        worker_counts = [w for w in worker_counts if w <= args.max_workers]
+
+        print(f"{'workers':>8} {'seconds':>9} {'files/s':>9} {'speedup':>8}")
+        baseline = None
+        for workers in worker_counts:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                data, processed_count, errors = process_directory(corpus_dir, workers=workers)
+            elapsed = time.perf_counter() - start
+            assert processed_count == args.files, errors[:5]
+
+            baseline = baseline or elapsed
+            print(f"{workers:>8} {elapsed:>9.2f} {processed_count / elapsed:>9.1f} "
+                  f"{baseline / elapsed:>7.2f}x")
+    finally:
+        shutil.rmtree(corpus_dir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Cold start of the web app: importing wsgi and answering the first /health.
+
+Each run is a fresh interpreter, as a new gunicorn master is. The "eager"
+variant imports pandas and pdfplumber before the app, as the app's own
+imports used to; "lazy" imports only what the app imports now. Also
+lists which of the heavy libraries the app import pulled in. Run from the
+Python_tool directory:
+
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+HEAVY_MODULES = ('pandas', 'numpy', 'pyarrow', 'pdfplumber', 'pdfminer', 'pypdfium2')
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+if {eager}:
+    import pandas, pdfplumber
+import wsgi
+imported = time.perf_counter()
+response = wsgi.app.test_client().get('/health')
+assert response.status_code == 200
+print(json.dumps({{
+    "import": imported - start,
+    "health": time.perf_counter() - start,
+    "heavy": [name for name in {heavy!r} if name in sys.modules],
+}}))
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='tds-startup-')
+    env = dict(os.environ, UPLOAD_FOLDER=os.path.join(work_dir, 'uploads'),
+               OUTPUT_FOLDER=os.path.join(work_dir, 'output'))
+    print(f"{'variant':>8} {'import s':>9} {'/health s':>10}  heavy modules loaded")
+    for variant in ('eager', 'lazy'):
+        runs = []
+        for _ in range(args.runs):
+            code = CHILD.format(eager=variant == 'eager', heavy=HEAVY_MODULES)
+            output = subprocess.run([sys.executable, '-c', code], env=env, check=True,
+                                    capture_output=True, text=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+        print(f"{variant:>8} {statistics.median(run['import'] for run in runs):>9.3f} "
+              f"{statistics.median(run['health'] for run in runs):>10.3f}  {', '.join(runs[-1]['heavy']) or '-'}")
+
+if __name__ == '__main__':
+    main()
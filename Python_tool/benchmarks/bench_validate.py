@@ -0,0 +1,83 @@
+"""Vectorized validate_csv against the row-by-row loop it replaced.
+
+Run from the Python_tool directory:
+
+    python -m benchmarks.bench_validate --rows 300000
+"""
+import argparse
+import os
+import random
+import re
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.corpus import random_pan
+from validatecsv import validate_csv
+
+def legacy_validate(csv_file):
+    """The iterrows loop as it was before vectorizing, returning its errors."""
+    df = pd.read_csv(csv_file)
+    errors = []
+    for index, row in df.iterrows():
+        pan = row.get("PAN of deductee", "")
+        total_paid = row.get("Total Amount paid", 0)
+        total_tds = row.get("Total TDS", 0)
+
+        row_errors = []
+        if not re.match(r"^[A-Z]{5}[0-9]{4}[A-Z]$", str(pan)):
+            row_errors.append("Invalid PAN format")
+        if pd.isna(total_paid) or pd.isna(total_tds):
+            row_errors.append("Missing total paid or total TDS")
+        if total_paid < 0 or total_tds < 0:
+            row_errors.append("Negative values found")
+        if total_tds > total_paid:
+            row_errors.append("TDS cannot be greater than total amount paid")
+        if row_errors:
+            errors.append({"Row": index + 1, "Errors": row_errors})
+    return errors
+
+def write_rows(path, rows, seed=0):
+    rng = random.Random(seed)
+    records = []
+    for i in range(rows):
+        total_paid = round(rng.uniform(1000, 500000), 2)
+        records.append({
+            "PAN of deductee": random_pan(rng) if rng.random() > 0.01 else "BAD" + str(i),
+            "Total Amount paid": total_paid if rng.random() > 0.01 else None,
+            "Total TDS": round(total_paid * (0.1 if rng.random() > 0.01 else 1.5), 2),
+            "Name of deal": f"Deal {i % 50:03d}",
+        })
+    pd.DataFrame(records).to_csv(path, index=False)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--chunksize', type=int, default=100000)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    os.close(fd)
+    try:
+        write_rows(path, args.rows)
+
+        start = time.perf_counter()
+        legacy = legacy_validate(path)
+        legacy_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        errors = validate_csv(path, chunksize=args.chunksize)
+        vectorized_seconds = time.perf_counter() - start
+
+        expected = sorted((e["Row"], m) for e in legacy for m in e["Errors"])
+        found = sorted(zip(errors["Row"].tolist(), errors["Message"].tolist()))
+        print(f"rows: {args.rows}, errors: {len(found)}, same errors as legacy: {expected == found}")
+        print(f"{'legacy loop':>12} {legacy_seconds:>8.2f}s")
+        print(f"{'vectorized':>12} {vectorized_seconds:>8.2f}s  "
+              f"({legacy_seconds / vectorized_seconds:.0f}x faster)")
+    finally:
+        os.remove(path)
+
+if __name__ == '__main__':
+    main()
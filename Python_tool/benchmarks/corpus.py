@@ -0,0 +1,170 @@
+"""Synthetic Form 16A certificates for benchmarking the extraction engine.
+
+The PDFs are written by hand (Helvetica text objects only), so generating a
+corpus needs nothing beyond the standard library.
+"""
+import os
+import random
+import string
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+def write_pdf(path, pages):
+    """Write a minimal PDF with one page per list of text lines."""
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(None)  # filled in once the kids are known
+    page_ids = []
+    for lines in pages:
+        ops = ["BT", "/F1 9 Tf", "11 TL", "40 800 Td"]
+        for line in lines:
+            ops.append(f"({_escape(line)}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode('latin-1')
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+            % (pages_id, font_id, content_id)
+        ))
+    kids = b" ".join(b"%d 0 R" % i for i in page_ids)
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+    catalog_id = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_at = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, catalog_id, xref_at)
+
+    with open(path, 'wb') as f:
+        f.write(out)
+
+def format_inr(amount):
+    """Format an amount the way TRACES does, e.g. 1,23,456.00."""
+    whole, paise = f"{amount:.2f}".split('.')
+    if len(whole) > 3:
+        head, tail = whole[:-3], whole[-3:]
+        groups = []
+        while len(head) > 2:
+            groups.insert(0, head[-2:])
+            head = head[:-2]
+        if head:
+            groups.insert(0, head)
+        whole = ','.join(groups + [tail])
+    return f"{whole}.{paise}"
+
+def random_pan(rng):
+    letters = string.ascii_uppercase
+    return (''.join(rng.choice(letters) for _ in range(5))
+            + ''.join(rng.choice(string.digits) for _ in range(4))
+            + rng.choice(letters))
+
+def certificate_pages(pan, quarter, total_paid, total_tds, page_count, rng):
+    """Lines of text for each page of a Form 16A certificate."""
+    receipt = ''.join(rng.choice(string.ascii_uppercase) for _ in range(8))
+    payments = [round(total_paid / 3, 2)] * 2
+    payments.append(round(total_paid - sum(payments), 2))
+
+    first = [
+        "FORM NO. 16A",
+        "[See rule 31(1)(b)]",
+        "Certificate under section 203 of the Income-tax Act, 1961 for tax deducted at source",
+        f"Certificate No. {receipt}1 Last updated on 15-Jan-2025",
+        "PAN of the Deductor TAN of the Deductor PAN of the Deductee",
+        f"AAACX1234Q MUMX12345A {pan}",
+        "Assessment Year Period From To",
+        "2025-26 01-Apr-2024 31-Mar-2025",
+        "Summary of payment",
+        "Sl. No. Amount paid/credited Nature of payment Deductee Reference No. Date of payment/credit",
+    ]
+    for number, amount in enumerate(payments, start=1):
+        first.append(f"{number} {format_inr(amount)} 194A 0 12-Nov-2024")
+    first += [
+        f"Total (Rs.) {format_inr(total_paid)}",
+        "Summary of tax deducted at source in respect of deductee",
+        "Quarter Receipt Numbers of original quarterly statements of TDS Amount of tax deducted "
+        "Amount of tax deposited/remitted",
+        f"{quarter} {receipt} {format_inr(total_tds)} {format_inr(total_tds)}",
+        f"Total (Rs.) {format_inr(total_tds)} {format_inr(total_tds)}",
+    ]
+    pages = [first]
+    for number in range(2, page_count + 1):
+        pages.append([
+            f"Page {number} of {page_count}",
+            "DETAILS OF TAX DEDUCTED AND DEPOSITED IN THE CENTRAL GOVERNMENT ACCOUNT THROUGH CHALLAN",
+            "Sl. No. Tax Deposited in respect of the deductee BSR Code of the Bank Branch "
+            "Date on which Tax deposited Challan Serial Number Status of matching with OLTAS",
+        ] + [
+            f"{i} {format_inr(total_tds / 3)} 0510308 07-Dec-2024 {rng.randint(10000, 99999)} F"
+            for i in range(1, 40)
+        ])
+    return pages
+
+# What a quarter's uploads look like in practice: mostly one-page
+# certificates with the odd long challan listing, a few deals filed under a
+# fund folder, and file names in whatever form the deductor saved them
+VARIED_PAGE_COUNTS = (1, 1, 1, 1, 2, 2, 3, 5, 10)
+QUARTERS = ('Q1', 'Q2', 'Q3', 'Q4')
+FILENAME_STYLES = (
+    "{pan}_{quarter}_2024-25.pdf",
+    "{pan}.pdf",
+    "Form16A_{pan}_FY2024-25_{quarter}.pdf",
+    "TDS Certificate - {pan} ({quarter}).pdf",
+)
+
+def generate_corpus(base_dir, files=100, deals=5, quarter='Q3', page_counts=(1, 2, 3), seed=0, varied=False):
+    """Write ``files`` certificates spread over ``deals`` deal folders.
+
+    With ``varied`` each certificate also gets a random quarter, a page
+    count from VARIED_PAGE_COUNTS and a name in one of FILENAME_STYLES, and
+    every other deal folder sits inside a fund folder; ``quarter`` and
+    ``page_counts`` are then ignored. Expected records carry the quarter.
+
+    Returns the list of (pdf_path, expected_record) pairs that were written.
+    """
+    rng = random.Random(seed)
+    written = []
+    for index in range(files):
+        deal_number = index % deals + 1
+        deal_name = f"Deal {deal_number:03d}"
+        deal_dir = os.path.join(base_dir, deal_name)
+        file_quarter = quarter
+        file_pages = page_counts
+        filename_style = FILENAME_STYLES[0]
+        if varied:
+            if deal_number % 2 == 0:
+                deal_dir = os.path.join(base_dir, f"Fund {deal_number % 3 + 1}", deal_name)
+            file_quarter = rng.choice(QUARTERS)
+            file_pages = VARIED_PAGE_COUNTS
+            filename_style = rng.choice(FILENAME_STYLES)
+        os.makedirs(deal_dir, exist_ok=True)
+
+        pan = random_pan(rng)
+        total_paid = round(rng.uniform(10000, 5000000), 2)
+        total_tds = round(total_paid * 0.1, 2)
+        pages = certificate_pages(pan, file_quarter, total_paid, total_tds,
+                                  rng.choice(file_pages), rng)
+
+        pdf_path = os.path.join(deal_dir, filename_style.format(pan=pan, quarter=file_quarter))
+        write_pdf(pdf_path, pages)
+        written.append((pdf_path, {
+            "PAN of deductee": pan,
+            "Total Amount paid": total_paid,
+            "Total TDS": total_tds,
+            "Name of deal": deal_name,
+            "Quarter": file_quarter,
+        }))
+    return written
@@ -0,0 +1,67 @@
+"""A local folder served through the Drive client interface of drive_ingest.
+
+Folder ids are paths relative to the root ('' is the root itself), and
+every call sleeps for ``latency`` seconds to stand in for the network.
+``flaky`` names files whose first download fails, to exercise retries.
+Like PyDriveClient, downloads fetch the listed downloadUrl, with no
+metadata lookup, over one connection per downloading thread; the
+connections opened are counted.
+"""
+import hashlib
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+
+from drive_ingest import FOLDER_MIMETYPE
+
+class FakeDriveClient:
+    def __init__(self, root, latency=0.05, flaky=()):
+        self.root = root
+        self.latency = latency
+        self.flaky = set(flaky)
+        self.downloads = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def list_children(self, folder_id):
+        time.sleep(self.latency)
+        folder = os.path.join(self.root, folder_id)
+        children = []
+        for name in os.listdir(folder):
+            relative = os.path.join(folder_id, name) if folder_id else name
+            path = os.path.join(folder, name)
+            if os.path.isdir(path):
+                children.append({'id': relative, 'title': name, 'mimeType': FOLDER_MIMETYPE})
+                continue
+            with open(path, 'rb') as f:
+                md5 = hashlib.md5(f.read()).hexdigest()
+            modified = datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+            children.append({
+                'id': relative,
+                'title': name,
+                'mimeType': 'application/pdf',
+                'md5Checksum': md5,
+                'modifiedDate': modified.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+                'fileSize': str(os.path.getsize(path)),
+                'downloadUrl': f"fake://{relative}",
+            })
+        return children
+
+    def _connect(self):
+        if not getattr(self._local, 'connected', False):
+            self._local.connected = True
+            with self._lock:
+                self.connections += 1
+
+    def download(self, file, path):
+        self._connect()
+        time.sleep(self.latency)
+        with self._lock:
+            self.downloads += 1
+            if file['title'] in self.flaky:
+                self.flaky.discard(file['title'])
+                raise IOError("simulated dropped connection")
+        shutil.copyfile(os.path.join(self.root, file['downloadUrl'][len("fake://"):]), path)
@@ -0,0 +1,254 @@
+"""End-to-end benchmark of every extraction entry point, saved for comparison.
+
+Generates a varied synthetic quarter (see corpus.generate_corpus), then runs
+each entry point in a fresh interpreter so its peak RSS is its own:
+
+    process_pdf        one file at a time, in this process
+    process_directory  the worker pool over the deal folders
+    process_zip        the worker pool over the same files zipped
+    pdf_to_csv         the CLI, directory to CSV on disk
+
+and times the stages of a serial read (open, text extract, regex scan,
+CSV write) file by file. Run from the Python_tool directory:
+
+    python -m benchmarks.suite --files 300 --output results/HEAD.json
+    python -m benchmarks.suite --files 300 --compare results/HEAD.json
+
+The JSON holds the commit, machine and settings next to the numbers, so
+results from two commits can be compared with --compare.
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from zipfile import ZipFile
+
+from benchmarks.corpus import generate_corpus
+
+ENTRY_POINTS = ('process_pdf', 'process_directory', 'process_zip', 'pdf_to_csv')
+STAGES = ('open', 'extract', 'regex', 'csv_write')
+
+def _own_peak_kb():
+    # Linux keeps ru_maxrss across exec, so a child would report the suite's
+    # own peak; VmHWM starts afresh with the new program
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _peak_rss_mb():
+    # In kilobytes on Linux; worker processes count as children
+    peak = max(_own_peak_kb(), resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(peak / 1024, 1)
+
+def _records(entry_point, corpus_dir, work_dir, engine):
+    from extraction import find_pdf_files, process_directory, process_pdf, process_zip
+
+    if entry_point == 'process_pdf':
+        records = [process_pdf(path, deal_name, engine=engine) for path, deal_name in find_pdf_files(corpus_dir)]
+        return [record for record in records if record]
+    if entry_point == 'process_directory':
+        return process_directory(corpus_dir, engine=engine)[0]
+    if entry_point == 'process_zip':
+        return process_zip(os.path.join(work_dir, 'corpus.zip'), engine=engine)[0]
+
+    import pdf_to_csv
+
+    output_csv = os.path.join(work_dir, 'output.csv')
+    pdf_to_csv.main(corpus_dir, output_csv, engine=engine)
+    with open(output_csv, newline='') as f:
+        return [{**row, "Total Amount paid": float(row["Total Amount paid"]), "Total TDS": float(row["Total TDS"])}
+                for row in csv.DictReader(f)]
+
+def run_entry_point(entry_point, corpus_dir, work_dir, engine):
+    """Run one entry point over the corpus; return its measurements."""
+    with open(os.path.join(work_dir, 'expected.json')) as f:
+        expected = {record["PAN of deductee"]: record for record in json.load(f)}
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    with contextlib.redirect_stdout(io.StringIO()):
+        records = _records(entry_point, corpus_dir, work_dir, engine)
+    elapsed = time.perf_counter() - start
+
+    correct = sum(
+        1 for record in records
+        if record["PAN of deductee"] in expected
+        and all(record[field] == expected[record["PAN of deductee"]][field]
+                for field in ("Total Amount paid", "Total TDS", "Name of deal"))
+    )
+    return {
+        "files": len(expected),
+        "records": len(records),
+        "correct": correct,
+        "seconds": round(elapsed, 3),
+        "cpu_seconds": round(time.process_time() - cpu_start, 3),
+        "files_per_second": round(len(expected) / elapsed, 2),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+def time_stages(corpus_dir, work_dir, engine):
+    """Per-file milliseconds spent in each stage of a serial, early-exit read."""
+    from extraction import TEXT_ENGINES, check_engine, find_pdf_files, open_source, source_name
+    from fields import FieldScanner, build_fields, extract_pan_from_filename
+    from outputs import open_writer
+
+    engine = check_engine(engine)
+    fields = build_fields()
+    timings = {stage: [] for stage in STAGES}
+    with open_writer(os.path.join(work_dir, 'stages.csv'), 'csv') as writer:
+        for path, deal_name in find_pdf_files(corpus_dir):
+            spent = dict.fromkeys(STAGES, 0.0)
+            scanner = FieldScanner(fields)
+            mark = time.perf_counter()
+            with open_source(path) as stream, TEXT_ENGINES[engine](stream) as (page_count, texts):
+                now = time.perf_counter()
+                spent['open'] += now - mark
+                mark = now
+                for page_text in texts:
+                    now = time.perf_counter()
+                    spent['extract'] += now - mark
+                    scanner.feed((page_text or "") + "\n")
+                    mark = time.perf_counter()
+                    spent['regex'] += mark - now
+                    if scanner.complete():
+                        break
+
+            values = scanner.values()
+            mark = time.perf_counter()
+            writer.write({
+                "PAN of deductee": extract_pan_from_filename(source_name(path)),
+                "Total Amount paid": values["Total Amount paid"],
+                "Total TDS": values["Total TDS"],
+                "Name of deal": deal_name,
+            })
+            spent['csv_write'] += time.perf_counter() - mark
+            for stage, seconds in spent.items():
+                timings[stage].append(seconds * 1000)
+
+    summary = {}
+    for stage, values in timings.items():
+        values.sort()
+        summary[stage] = {
+            "mean_ms": round(statistics.fmean(values), 3),
+            "p50_ms": round(values[len(values) // 2], 3),
+            "p95_ms": round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+        }
+    return summary
+
+def _child(entry_point, corpus_dir, work_dir, engine):
+    # A fresh interpreter per entry point keeps peak RSS from carrying over
+    command = [sys.executable, '-m', 'benchmarks.suite', '--child', entry_point,
+               '--corpus', corpus_dir, '--work-dir', work_dir]
+    if engine:
+        command += ['--engine', engine]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def _commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], check=True,
+                                capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], check=True,
+                               capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+def _change(new, old):
+    return f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+
+def print_results(results, baseline=None):
+    print(f"{'entry point':>18} {'files/s':>9} {'seconds':>9} {'peak MB':>8} {'correct':>9}"
+          + (f" {'files/s':>9} {'peak MB':>8}" if baseline else ""))
+    for entry_point, result in results["entry_points"].items():
+        line = (f"{entry_point:>18} {result['files_per_second']:>9.1f} {result['seconds']:>9.2f} "
+                f"{result['peak_rss_mb']:>8.1f} {result['correct']:>4}/{result['files']:<4}")
+        old = (baseline or {}).get("entry_points", {}).get(entry_point)
+        if old:
+            line += (f" {_change(result['files_per_second'], old['files_per_second']):>9}"
+                     f" {_change(result['peak_rss_mb'], old['peak_rss_mb']):>8}")
+        print(line)
+
+    print(f"\n{'stage':>18} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}" + (f" {'p50':>9}" if baseline else ""))
+    for stage, result in results["stages"].items():
+        line = f"{stage:>18} {result['mean_ms']:>9.3f} {result['p50_ms']:>9.3f} {result['p95_ms']:>9.3f}"
+        old = (baseline or {}).get("stages", {}).get(stage)
+        if old:
+            line += f" {_change(result['p50_ms'], old['p50_ms']):>9}"
+        print(line)
+    if baseline:
+        print(f"\nchanges are against {baseline.get('commit') or 'the baseline'}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=300)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--engine', default=None, help="text engine (default: TDS_TEXT_ENGINE or pdfplumber)")
+    parser.add_argument('--entry-points', nargs='+', choices=ENTRY_POINTS, default=list(ENTRY_POINTS))
+    parser.add_argument('--output', help="write the results here as JSON")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare against")
+    parser.add_argument('--child', choices=ENTRY_POINTS, help=argparse.SUPPRESS)
+    parser.add_argument('--corpus', help=argparse.SUPPRESS)
+    parser.add_argument('--work-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_entry_point(args.child, args.corpus, args.work_dir, args.engine)))
+        return
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    work_dir = tempfile.mkdtemp(prefix='tds-suite-')
+    try:
+        # Not named after a quarter, so every certificate is read by the
+        # rules that don't depend on one - the corpus mixes all four
+        corpus_dir = os.path.join(work_dir, 'certificates')
+        written = generate_corpus(corpus_dir, files=args.files, seed=args.seed, varied=True)
+        with open(os.path.join(work_dir, 'expected.json'), 'w') as f:
+            json.dump([record for _, record in written], f)
+        with ZipFile(os.path.join(work_dir, 'corpus.zip'), 'w') as zf:
+            for path, _ in written:
+                zf.write(path, os.path.relpath(path, corpus_dir))
+
+        results = {
+            "commit": _commit(),
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "settings": {"files": args.files, "seed": args.seed, "engine": args.engine},
+            "entry_points": {},
+            "stages": time_stages(corpus_dir, work_dir, args.engine),
+        }
+        for entry_point in args.entry_points:
+            results["entry_points"][entry_point] = _child(entry_point, corpus_dir, work_dir, args.engine)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_results(results, baseline)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Spotting the same certificate filed under more than one deal folder.
+
+A DedupIndex remembers every certificate twice over: by the SHA-256 of
+its bytes, so later byte-for-byte copies are skipped before they are
+parsed, and by PAN, quarter and amounts, so a copy that was re-saved or
+re-scanned still gets flagged once its totals are read. Keys are kept as
+16-byte digests, which keeps an index of hundreds of thousands of
+certificates to some tens of MB. Given a SQLite file the index outlives
+the job, so a copy is caught in a later upload as well.
+"""
+import hashlib
+import os
+import time
+
+from extraction_cache import file_digest
+from storage import open_database, transaction
+
+# Days a certificate stays known to a persistent index
+DEFAULT_MAX_AGE_DAYS = float(os.environ.get('TDS_DEDUP_MAX_AGE_DAYS', 400))
+
+def record_key(record, quarter=None, scope=''):
+    """Digest of a record's PAN, quarter and amounts, or None if any are missing."""
+    pan = record.get("PAN of deductee")
+    try:
+        paid = round(float(record["Total Amount paid"]) * 100)
+        tds = round(float(record["Total TDS"]) * 100)
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not pan:
+        return None
+    return hashlib.blake2b(f"{scope}|{pan}|{quarter or ''}|{paid}|{tds}".encode(), digest_size=16).digest()
+
+class DedupIndex:
+    """Index of the certificates seen so far, in memory or backed by SQLite.
+
+    Without ``path`` it covers one job (or whatever shares the object).
+    With one, keys are also looked up in and added to that file, so a
+    certificate first seen in an earlier upload counts too. A file only
+    counts as a copy when the first one was under another name, so
+    uploading the same folders again flags nothing. Record keys are scoped
+    to ``scope`` (e.g. the fiscal year and quarter), since the quarter
+    number alone comes round every year; without a scope they stay in
+    memory, as rent or interest paid in the same amounts every quarter
+    would otherwise match last quarter's upload. New keys are written by
+    flush(), and keys older than ``max_age_days`` are dropped then.
+    """
+
+    def __init__(self, path=None, scope='', max_age_days=DEFAULT_MAX_AGE_DAYS):
+        self.path = path
+        self.scope = scope or ''
+        self.max_age_days = max_age_days
+        self._copies = {}
+        self._records = {}
+        self._new = {}
+        # Tables whose keys are kept in the file
+        self._stored = {'copies', 'records'} if self.scope else {'copies'}
+        if path:
+            open_database(path)
+            with transaction(path) as conn:
+                for table in ('copies', 'records'):
+                    conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ("
+                                 " key BLOB PRIMARY KEY, label TEXT NOT NULL, first_seen REAL NOT NULL)")
+
+    def digest(self, source):
+        return file_digest(source)
+
+    def first_copy(self, digest, label):
+        """Label of the file first seen with these bytes, or None if that was ``label`` itself."""
+        if not digest:
+            return None
+        return self._first('copies', self._copies, bytes.fromhex(digest)[:16], label)
+
+    def first_record(self, record, quarter, label):
+        """Label of the file first seen with this PAN, quarter and amounts, or None if that was ``label``."""
+        key = record_key(record, quarter, self.scope)
+        if key is None:
+            return None
+        return self._first('records', self._records, key, label)
+
+    def forget_copy(self, digest, label):
+        """Stop naming ``label`` as the first file with these bytes, e.g. because it failed.
+
+        Only a key added since the last flush is dropped.
+        """
+        key = bytes.fromhex(digest)[:16]
+        if self._copies.get(key) == label and (not self.path or ('copies', key) in self._new):
+            del self._copies[key]
+            self._new.pop(('copies', key), None)
+
+    def _first(self, table, index, key, label):
+        stored = self.path and table in self._stored
+        first = index.get(key)
+        if first is None and stored:
+            with transaction(self.path) as conn:
+                row = conn.execute(f"SELECT label FROM {table} WHERE key = ?", (key,)).fetchone()
+            first = row[0] if row else None
+        if first is None:
+            first = label
+            if stored:
+                self._new[table, key] = label
+        index[key] = first
+        return None if first == label else first
+
+    def flush(self):
+        """Write the keys added since the last flush to the SQLite file, if any."""
+        if not self.path or not self._new:
+            return
+        now = time.time()
+        with transaction(self.path) as conn:
+            for table in ('copies', 'records'):
+                conn.executemany(f"INSERT OR IGNORE INTO {table} VALUES (?, ?, ?)",
+                                 [(key, label, now) for (name, key), label in self._new.items() if name == table])
+                if self.max_age_days:
+                    conn.execute(f"DELETE FROM {table} WHERE first_seen < ?", (now - self.max_age_days * 86400,))
+        self._new = {}
+
+    def __len__(self):
+        return len(self._copies) + len(self._records)
@@ -0,0 +1,203 @@
+"""Concurrent, resumable download of a Google Drive folder of certificates.
+
+A Drive client here is anything with two methods:
+
+    list_children(folder_id) -> [{'id', 'title', 'mimeType', 'md5Checksum',
+                                  'modifiedDate', 'fileSize'}, ...]
+    download(file, path)     -> writes the file's bytes to ``path``
+
+download() is called from several threads at once, with a file as
+list_children returned it. PyDriveClient adapts a pydrive GoogleDrive;
+benchmarks/fake_drive.py serves a local folder the same way, with
+simulated latency.
+"""
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import open_database, transaction
+
+FOLDER_MIMETYPE = 'application/vnd.google-apps.folder'
+
+# Downloads in flight at once
+DEFAULT_DOWNLOADS = int(os.environ.get('TDS_DRIVE_DOWNLOADS', 8))
+DOWNLOAD_ATTEMPTS = 3
+
+class PyDriveClient:
+    """Drive client over a pydrive GoogleDrive.
+
+    The drive's httplib2.Http is not thread-safe, so it is only used for
+    listing; each downloading thread authorizes an Http of its own and
+    fetches the downloadUrl the listing already gave, with no metadata
+    request per file.
+    """
+
+    def __init__(self, drive):
+        self.drive = drive
+        self._local = threading.local()
+
+    def list_children(self, folder_id):
+        return self.drive.ListFile({'q': f"'{folder_id}' in parents and trashed=false"}).GetList()
+
+    def _http(self):
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            # Installed with pydrive, which is only imported for Drive jobs
+            import httplib2
+            http = self._local.http = self.drive.auth.credentials.authorize(httplib2.Http())
+        return http
+
+    def download(self, file, path):
+        url = file.get('downloadUrl')
+        if not url:
+            raise IOError(f"{file['title']} has no content to download")
+        response, content = self._http().request(url)
+        if response.status != 200:
+            raise IOError(f"Drive answered {response.status} for {file['title']}")
+        with open(path, 'wb') as f:
+            f.write(content)
+
+def folder_id_from_link(link):
+    """Folder id from a Drive share link (?id=... or /folders/...) or a bare id."""
+    match = re.search(r"[?&]id=([\w-]+)", link) or re.search(r"/folders/([\w-]+)", link)
+    return match.group(1) if match else link.strip()
+
+def list_pdfs(client, folder_id, path=()):
+    """Yield (file, folder path) for every PDF under ``folder_id``, depth first.
+
+    The folder path is the tuple of folder titles below the shared folder;
+    the deal is the last of them, as with a local folder tree.
+    """
+    children = sorted(client.list_children(folder_id), key=lambda f: f['title'])
+    for child in children:
+        if child.get('mimeType') == FOLDER_MIMETYPE:
+            yield from list_pdfs(client, child['id'], path + (child['title'],))
+        elif child['title'].lower().endswith('.pdf'):
+            yield child, path
+
+def _safe_name(title):
+    # Drive titles may contain slashes; they must not create folders here
+    return title.replace('/', '_').replace('\\', '_').strip() or '_'
+
+class DriveSync:
+    """Mirror the PDFs of a Drive folder into ``local_dir`` on a thread pool.
+
+    Each file is recorded in a small SQLite state file once downloaded, with
+    its Drive md5 and modifiedDate, so a rerun (or a retry after a crash)
+    skips every file that is still on disk and unchanged in Drive, and only
+    fetches the rest. Completed files are put on ``ready`` as
+    (path, deal_name) the moment they land, followed by None once
+    everything has been tried, so extraction can start on the first file
+    while the others are still downloading.
+    """
+
+    def __init__(self, client, folder_id, local_dir, workers=DEFAULT_DOWNLOADS):
+        self.client = client
+        self.folder_id = folder_id
+        self.local_dir = local_dir
+        self.workers = workers
+        self.ready = queue.Queue()
+        self.errors = []
+        self.downloaded = 0
+        self.skipped = 0
+        self._state_path = os.path.join(local_dir, '.drive_state.sqlite3')
+        self._lock = threading.Lock()
+        open_database(self._state_path)
+        with transaction(self._state_path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " id TEXT PRIMARY KEY, path TEXT NOT NULL, md5 TEXT, modified TEXT, size INTEGER)"
+            )
+
+    def start(self):
+        """List the folder and start downloading in the background; return self."""
+        threading.Thread(target=self._run, name='tds-drive', daemon=True).start()
+        return self
+
+    def run(self):
+        """Download everything in the calling thread; return the (path, deal_name) list."""
+        self._run()
+        tasks = []
+        for task in iter(self.ready.get, None):
+            tasks.append(task)
+        return tasks
+
+    def _run(self):
+        try:
+            with transaction(self._state_path) as conn:
+                state = {row[0]: row[1:] for row in conn.execute("SELECT id, path, md5, modified, size FROM files")}
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tds-drive') as executor:
+                for file, folders in list_pdfs(self.client, self.folder_id):
+                    relative = os.path.join(*[_safe_name(name) for name in folders], _safe_name(file['title']))
+                    path = os.path.join(self.local_dir, relative)
+                    deal_name = folders[-1] if folders else os.path.basename(os.path.normpath(self.local_dir))
+                    if self._unchanged(file, path, state.get(file['id'])):
+                        with self._lock:
+                            self.skipped += 1
+                        self.ready.put((path, deal_name))
+                        continue
+                    executor.submit(self._fetch, file, path, deal_name)
+        except Exception as e:
+            with self._lock:
+                self.errors.append(f"Error listing Drive folder: {str(e)}")
+        finally:
+            self.ready.put(None)
+
+    def _unchanged(self, file, path, stored):
+        if stored is None or not os.path.exists(path):
+            return False
+        stored_path, md5, modified, size = stored
+        if stored_path != path or os.path.getsize(path) != size:
+            return False
+        if file.get('md5Checksum'):
+            return file['md5Checksum'] == md5
+        return file.get('modifiedDate') == modified
+
+    def _fetch(self, file, path, deal_name):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part = path + '.part'
+        for attempt in range(1, DOWNLOAD_ATTEMPTS + 1):
+            try:
+                self.client.download(file, part)
+                os.replace(part, path)
+                break
+            except Exception as e:
+                if attempt == DOWNLOAD_ATTEMPTS:
+                    with self._lock:
+                        self.errors.append(f"Error downloading {file['title']}: {str(e)}")
+                    return
+                time.sleep(0.5 * 2 ** (attempt - 1))
+
+        with transaction(self._state_path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                (file['id'], path, file.get('md5Checksum'), file.get('modifiedDate'), os.path.getsize(path)),
+            )
+        with self._lock:
+            self.downloaded += 1
+        self.ready.put((path, deal_name))
+
+def ready_batches(sync):
+    """Yield lists of (path, deal_name) from a started DriveSync as they land.
+
+    Blocks for the first file of each batch, then takes whatever else is
+    already waiting, so batches grow while extraction is busy.
+    """
+    while True:
+        task = sync.ready.get()
+        if task is None:
+            return
+        batch = [task]
+        while True:
+            try:
+                task = sync.ready.get_nowait()
+            except queue.Empty:
+                break
+            if task is None:
+                yield batch
+                return
+            batch.append(task)
+        yield batch
@@ -0,0 +1,751 @@
+import io
+import os
+import posixpath
+import signal
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from functools import partial
+from zipfile import ZipFile
+
+from fields import (
+    FieldScanner,
+    build_fields,
+    extract_fields,
+    extract_pan_from_filename,
+    quarter_number,
+    spec_fingerprint,
+)
+from layouts import layouts_fingerprint, load_layouts, match_layout, page_chars, region_texts
+from memory import BudgetExceeded, FileBudget
+from profiling import PROFILE_THRESHOLD, new_profiler, profiling, save_profile
+from supervisor import supervise
+
+# Bump whenever process_pdf changes what it returns for the same bytes, so
+# results cached by an older extractor are thrown away
+EXTRACTOR_VERSION = 5
+
+def _usable_cpus():
+    # cpu_count() is the host's inside a container; the affinity mask is ours
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # no sched_getaffinity on macOS
+        return os.cpu_count() or 1
+
+# Most extraction processes a batch starts unless TDS_WORKERS says otherwise;
+# each holds its own pdfplumber, so a small instance can't afford one per core
+MAX_DEFAULT_WORKERS = 4
+# Extraction processes per batch
+DEFAULT_WORKERS = int(os.environ.get('TDS_WORKERS', min(_usable_cpus(), MAX_DEFAULT_WORKERS)))
+# Seconds one file may take before it is abandoned
+DEFAULT_FILE_TIMEOUT = float(os.environ.get('TDS_FILE_TIMEOUT', 120))
+# Seconds past the file timeout before a stuck worker is killed
+KILL_GRACE = float(os.environ.get('TDS_FILE_KILL_GRACE', 10))
+# Text engine used when a job doesn't pick one (see TEXT_ENGINES)
+DEFAULT_ENGINE = os.environ.get('TDS_TEXT_ENGINE', 'pdfplumber')
+
+# A PDF inside an uploaded ZIP, read straight from the archive
+ZipMember = namedtuple('ZipMember', ['zip_path', 'name'])
+
+# The stores a batch reads and updates, any of them None (see iter_results):
+#   cache       extraction_cache.ExtractionCache, results by content hash
+#   manifest    manifest.QuarterManifest, rows of files unchanged since the last run
+#   quarantine  quarantine.Quarantine, files that keep hanging or crashing workers
+#   dedup       dedup.DedupIndex, certificates seen before, possibly by earlier batches
+#   metrics     metrics.Metrics, per-stage timings and file counts
+BatchStores = namedtuple('BatchStores', ['cache', 'manifest', 'quarantine', 'dedup', 'metrics'],
+                         defaults=(None,) * 5)
+
+# The archive each thread read from last; reopening it per member would
+# re-parse the central directory thousands of times per batch. Kept per
+# thread, since job runners read different uploads at once and one must
+# never close a handle another is reading, and keyed by pid so forked
+# workers never share the parent's file offset. iter_results closes it
+# when a batch ends, so a deleted upload's space is given back.
+_open_zip = threading.local()
+
+def _zip_file(zip_path):
+    key = (os.getpid(), zip_path, os.path.getmtime(zip_path))
+    cached = getattr(_open_zip, 'archive', None)
+    if cached is None or cached[0] != key:
+        if cached is not None:
+            cached[1].close()
+        _open_zip.archive = cached = (key, ZipFile(zip_path))
+    return cached[1]
+
+def close_zip():
+    """Close the archive the calling thread has open, if any."""
+    cached = getattr(_open_zip, 'archive', None)
+    if cached is not None:
+        _open_zip.archive = None
+        cached[1].close()
+
+def source_name(source):
+    """File name of a path or ZipMember."""
+    if isinstance(source, ZipMember):
+        return posixpath.basename(source.name)
+    return os.path.basename(source)
+
+@contextmanager
+def open_source(source):
+    """Yield something pdfplumber can open for a path or ZipMember.
+
+    A ZIP member is decompressed into memory, never written to disk.
+    """
+    if isinstance(source, ZipMember):
+        with io.BytesIO(_zip_file(source.zip_path).read(source.name)) as buffer:
+            yield buffer
+    else:
+        yield source
+
+@contextmanager
+def open_source_stream(source):
+    """Yield a binary stream over the raw bytes of a path or ZipMember."""
+    if isinstance(source, ZipMember):
+        with _zip_file(source.zip_path).open(source.name) as stream:
+            yield stream
+    else:
+        with open(source, 'rb') as stream:
+            yield stream
+
+def source_key(source):
+    """Stable name of a source: the absolute path, or the member name in its ZIP."""
+    return source.name if isinstance(source, ZipMember) else os.path.abspath(source)
+
+def source_stamp(source):
+    """Cheap change marker: (size, mtime) for files, (size, CRC) for ZIP members."""
+    if isinstance(source, ZipMember):
+        info = _zip_file(source.zip_path).getinfo(source.name)
+        return info.file_size, f"crc:{info.CRC:08x}"
+    stat = os.stat(source)
+    return stat.st_size, f"mtime:{stat.st_mtime_ns}"
+
+def extract_total_amount_paid(text):
+    return extract_fields(text)["Total Amount paid"]
+
+def extract_total_tds(text, quarter=None):
+    return extract_fields(text, build_fields(quarter_number(quarter)))["Total TDS"]
+
+def _release_page(page):
+    if hasattr(page, 'close'):
+        page.close()  # pdfplumber >= 0.11
+        return
+    page.flush_cache()
+    page.get_textmap.cache_clear()
+
+def _plumber_texts(pdf):
+    # pdfplumber keeps every page's parsed layout until the document is
+    # closed; drop each one once the reader is done with its text, so a
+    # long certificate costs one page of objects at a time
+    for page in pdf.pages:
+        try:
+            yield page.extract_text()
+        finally:
+            _release_page(page)
+
+@contextmanager
+def _pdfplumber_pages(stream):
+    # Imported on first use, or up front by warm_up under gunicorn
+    import pdfplumber
+
+    with pdfplumber.open(stream) as pdf:
+        pages = _plumber_texts(pdf)
+        try:
+            yield len(pdf.pages), pages
+        finally:
+            pages.close()
+
+@contextmanager
+def _pdfium_pages(stream):
+    # PDFium reads the text objects in content-stream order with no layout
+    # analysis, which is all machine-generated TRACES certificates need
+    import pypdfium2
+
+    pdf = pypdfium2.PdfDocument(stream)
+
+    def texts():
+        for index in range(len(pdf)):
+            page = pdf[index]
+            textpage = page.get_textpage()
+            try:
+                yield textpage.get_text_range().replace("\r\n", "\n")
+            finally:
+                textpage.close()
+                page.close()
+
+    pages = texts()
+    try:
+        yield len(pdf), pages
+    finally:
+        pages.close()
+        pdf.close()
+
+# name -> context manager turning a PDF stream into (page count, page texts).
+# pdfplumber is the reference; lighter engines fall back to it per file.
+TEXT_ENGINES = {
+    'pdfplumber': _pdfplumber_pages,
+    'pdfium': _pdfium_pages,
+}
+
+def warm_up():
+    """Import the PDF and table libraries ahead of the first extraction.
+
+    Nothing imports them at module level, so the dev server and the CLIs
+    only load them when they first extract. gunicorn calls this in the
+    master before it forks (see gunicorn.conf.py), so every web worker and
+    the extraction processes they fork share one copy.
+    """
+    import pdfplumber  # noqa: F401
+    import pdfminer.layout  # noqa: F401
+    import pandas  # noqa: F401
+
+def check_engine(engine):
+    """Return ``engine`` (or the default); raise ValueError for an unknown one."""
+    engine = engine or DEFAULT_ENGINE
+    if engine not in TEXT_ENGINES:
+        raise ValueError(f"Unknown text engine '{engine}', choose one of: {', '.join(TEXT_ENGINES)}")
+    return engine
+
+def _timed(timings, stage, start):
+    # Add the time since ``start`` to ``stage``; return now for the next stage
+    now = time.perf_counter()
+    timings[stage] = timings.get(stage, 0.0) + now - start
+    return now
+
+def _feed(scanner, texts, early_exit, timings, budget, page_count):
+    """Feed page texts to ``scanner`` within ``budget``; return the number of pages read."""
+    pages_parsed = 0
+    mark = time.perf_counter()
+    for page_text in texts:
+        mark = _timed(timings, 'text_extract', mark)
+        pages_parsed += 1
+        budget.after_page(pages_parsed)
+        if page_text:
+            scanner.feed(page_text + "\n")
+        mark = _timed(timings, 'field_parse', mark)
+
+        # Every field sits above the second "Total (Rs.)", so a value
+        # found on an early page is the one a full scan would find
+        if early_exit and scanner.complete():
+            break
+        budget.next_page(pages_parsed, page_count)
+    return pages_parsed
+
+def _scan_with_layouts(stream, fields, early_exit, layouts, timings, budget):
+    # pdfminer parses page 1 once, whether its characters end up read
+    # through a template's regions or as the full text of the fallback
+    import pdfplumber
+
+    mark = time.perf_counter()
+    with pdfplumber.open(stream) as pdf:
+        mark = _timed(timings, 'pdf_open', mark)
+        layout = None
+        if pdf.pages:
+            first = pdf.pages[0]
+            chars = page_chars(first)
+            budget.after_page(1)
+            layout = match_layout(chars, (first.width, first.height), layouts)
+        if layout is not None:
+            scanner = FieldScanner(fields)
+            for region_text in region_texts(chars, layout):
+                mark = _timed(timings, 'text_extract', mark)
+                scanner.feed(region_text + "\n")
+                mark = _timed(timings, 'field_parse', mark)
+            # Only a region read where every field was found by its best
+            # rule is trusted; anything less is read again in full
+            if scanner.complete():
+                return scanner, 1, len(pdf.pages), layout.name
+        _timed(timings, 'text_extract', mark)
+        scanner = FieldScanner(fields)
+        texts = _plumber_texts(pdf)
+        try:
+            pages_parsed = _feed(scanner, texts, early_exit, timings, budget, len(pdf.pages))
+        finally:
+            texts.close()
+        return scanner, pages_parsed, len(pdf.pages), None
+
+def _scan(source, engine, fields, early_exit, timings, budget):
+    """Feed a document's pages to a FieldScanner, timing each stage into ``timings``.
+
+    ``budget`` (a memory.FileBudget) is checked around every page.
+
+    Returns the scanner, pages parsed, page count and the name of the
+    layout template whose regions were read (None for a full-text read).
+    """
+    layouts = load_layouts() if engine == 'pdfplumber' and early_exit else ()
+    mark = time.perf_counter()
+    with open_source(source) as stream:
+        if isinstance(source, ZipMember):
+            _timed(timings, 'zip_extract', mark)
+        if layouts:
+            return _scan_with_layouts(stream, fields, early_exit, layouts, timings, budget)
+        mark = time.perf_counter()
+        with TEXT_ENGINES[engine](stream) as (page_count, texts):
+            _timed(timings, 'pdf_open', mark)
+            scanner = FieldScanner(fields)
+            pages_parsed = _feed(scanner, texts, early_exit, timings, budget, page_count)
+    return scanner, pages_parsed, page_count, None
+
+def _implausible(values):
+    """How many of the checks a correctly read pair of totals always passes fail.
+
+    The same checks validatecsv flags as MISSING_AMOUNT, NEGATIVE_AMOUNT and
+    TDS_EXCEEDS_PAID; a misread row is the usual cause.
+    """
+    paid, tds = values["Total Amount paid"], values["Total TDS"]
+    if paid is None or tds is None:
+        return 1
+    return (paid < 0 or tds < 0) + (tds > paid)
+
+def process_pdf(source, deal_name, early_exit=True, stats=None, quarter=None, engine=None):
+    """Extract one certificate's record from a path or ZipMember.
+
+    Each page's text is extracted exactly once by the text ``engine`` (a
+    TEXT_ENGINES name) and fed to a FieldScanner. If a lighter engine leaves
+    a total unfound, the file is read again with pdfplumber. With
+    ``early_exit`` the remaining pages are skipped once every field is found
+    by its best rule; otherwise the document is scanned to the end.
+    With early exit, pdfplumber first tries the stored layout templates (see
+    layouts.py): a certificate whose first page matches one is read from
+    the template's regions alone. Totals that can't be right (a missing or
+    negative total, or TDS above the amount paid) from a template or a
+    lighter engine are read again from the full text with pdfplumber, and
+    the second read is kept if it fails fewer of those checks.
+    ``quarter`` ('1'..'4' or a label like 'FY 2024-25 Q2') picks the
+    quarterly row the TDS is read from, and each total comes with a
+    confidence flag. When ``stats`` is a dict it receives ``pages_parsed``,
+    ``page_count``, the ``engine`` that produced the record, the
+    ``layout`` template used, if any, ``reread`` when the totals were read
+    again, and the seconds spent in each stage
+    under ``timings`` (see metrics.STAGES), and the worker's ``peak_rss_mb``
+    while the file was read. A file that goes over the page or memory
+    budget (see memory.py) raises BudgetExceeded.
+    """
+    timings = {}
+    budget = FileBudget()
+    if stats is not None:
+        stats['timings'] = timings
+    try:
+        engine = check_engine(engine)
+        fields = build_fields(quarter_number(quarter))
+        scanner, pages_parsed, page_count, layout = _scan(source, engine, fields, early_exit, timings, budget)
+        if engine != 'pdfplumber' and None in scanner.values().values():
+            engine = 'pdfplumber'
+            scanner, reparsed, page_count, layout = _scan(source, engine, fields, early_exit, timings, budget)
+            pages_parsed += reparsed
+
+        reread = False
+        if (layout is not None or engine != 'pdfplumber') and _implausible(scanner.values()):
+            # A template region or a lighter engine may have picked up the wrong row
+            full, reparsed, page_count, _ = _scan(source, 'pdfplumber', fields, False, timings, budget)
+            pages_parsed += reparsed
+            reread = True
+            if _implausible(full.values()) < _implausible(scanner.values()):
+                scanner, engine, layout = full, 'pdfplumber', None
+
+        if stats is not None:
+            stats['pages_parsed'] = pages_parsed
+            stats['page_count'] = page_count
+            stats['engine'] = engine
+            stats['layout'] = layout
+            if reread:
+                stats['reread'] = True
+
+        values = scanner.values()
+        confidences = scanner.confidences()
+        pan = extract_pan_from_filename(source_name(source))
+
+        return {
+            "PAN of deductee": pan,
+            "Total Amount paid": values["Total Amount paid"],
+            "Total TDS": values["Total TDS"],
+            "Name of deal": deal_name,
+            "Total Amount paid confidence": confidences["Total Amount paid"],
+            "Total TDS confidence": confidences["Total TDS"]
+        }
+    except Exception as e:
+        print(f"Error processing {source}: {str(e)}")
+        return None
+    finally:
+        if stats is not None:
+            stats['peak_rss_mb'] = round(budget.peak_rss_mb, 1)
+
+def extractor_fingerprint():
+    """Identify the extractor that produced a result.
+
+    Mixes EXTRACTOR_VERSION with the field spec's patterns and rules, so
+    editing a pattern invalidates cached results on its own. Stored layout
+    templates change which text is read, so they are part of it too.
+    """
+    layouts = layouts_fingerprint()
+    return f"{EXTRACTOR_VERSION}-{spec_fingerprint()}" + (f"-{layouts}" if layouts else "")
+
+class FileTimeout(BaseException):
+    """Raised inside a worker when one PDF runs past its time limit.
+
+    Derives from BaseException so the blanket ``except Exception`` in
+    process_pdf cannot swallow it.
+    """
+
+@contextmanager
+def _time_limit(seconds):
+    # SIGALRM only exists on POSIX and can only be handled in the main thread,
+    # which is where supervised workers run their tasks. Elsewhere (e.g. a
+    # threaded caller of process_pdf) the limit is not enforced.
+    if (not seconds or not hasattr(signal, 'SIGALRM')
+            or threading.current_thread() is not threading.main_thread()):
+        yield
+        return
+
+    def _raise_timeout(signum, frame):
+        raise FileTimeout()
+
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+def find_pdf_files(base_dir):
+    """Return (pdf_path, deal_name) pairs under base_dir in a stable order.
+
+    The deal name is the name of the folder that directly contains the PDF.
+    """
+    tasks = []
+    for root, dirs, files in os.walk(base_dir):
+        dirs.sort()
+        deal_name = os.path.basename(root)
+        for filename in sorted(files):
+            if filename.lower().endswith('.pdf'):
+                tasks.append((os.path.join(root, filename), deal_name))
+    return tasks
+
+def find_zip_members(zip_path):
+    """Return (ZipMember, deal_name) pairs for the PDFs inside a ZIP.
+
+    The deal name is the folder that directly contains the member; PDFs at
+    the top of the archive take the archive's own name.
+    """
+    fallback_deal = os.path.splitext(os.path.basename(zip_path))[0]
+    tasks = []
+    with ZipFile(zip_path) as zf:
+        for info in zf.infolist():
+            name = info.filename
+            if info.is_dir() or not name.lower().endswith('.pdf') or name.startswith('__MACOSX/'):
+                continue
+            deal_name = posixpath.basename(posixpath.dirname(name)) or fallback_deal
+            tasks.append((ZipMember(zip_path, name), deal_name))
+    tasks.sort(key=lambda task: task[0].name)
+    return tasks
+
+def _process_one(source, deal_name, timeout, pdf_options, profile_dir=None):
+    label = f"{deal_name}/{source_name(source)}"
+    stats = {"file": label, "pages_parsed": 0, "page_count": None}
+    profiler = new_profiler(profile_dir)
+    start = time.perf_counter()
+    try:
+        with _time_limit(timeout), profiling(profiler):
+            result = process_pdf(source, deal_name, stats=stats, **pdf_options)
+        error = None if result else f"Could not extract data from {label}"
+    except FileTimeout:
+        result, error = None, f"Timed out after {timeout:g}s processing {label}"
+        stats["failure"] = f"timed out after {timeout:g}s"
+    except BudgetExceeded as e:
+        result, error = None, f"Skipped {label}: {str(e)}"
+    except Exception as e:
+        result, error = None, f"Error processing {label}: {str(e)}"
+    stats["seconds"] = round(time.perf_counter() - start, 4)
+    stats["bytes"] = _source_size(source)
+
+    # Timed-out files are the ones most worth a look, so they keep theirs too
+    if profiler is not None and stats["seconds"] >= PROFILE_THRESHOLD:
+        stats["profile"] = save_profile(profiler, profile_dir, stats)
+    return result, error, stats
+
+def _source_size(source):
+    try:
+        return source_stamp(source)[0]
+    except (OSError, KeyError):
+        return None
+
+def _process_item(item, timeout, pdf_options, profile_dir=None):
+    # Runs inside a supervised worker, once per (index, source, deal_name)
+    _, source, deal_name = item
+    return _process_one(source, deal_name, timeout, pdf_options, profile_dir)
+
+def _run_chunks(indexed, workers, chunk_size, timeout, pdf_options, profile_dir=None):
+    """Yield (index, result, error, stats) for every task, in completion order.
+
+    Files run in supervised worker processes (see supervisor.py), so a PDF
+    that hangs past its hard limit or crashes the interpreter costs only
+    its own result: it is retried alone, then reported with a "failure",
+    the "seconds" its last try ran and, when it was stopped at the hard
+    limit, "killed".
+    """
+    if not chunk_size:
+        # A few chunks per worker keeps every core busy to the end of the
+        # batch without paying pickling overhead for each single file
+        chunk_size = max(1, min(32, len(indexed) // (workers * 4)))
+    # The in-worker alarm stops slow Python code; the kill is for native hangs
+    hard_limit = timeout + KILL_GRACE if timeout else None
+    run = partial(_process_item, timeout=timeout, pdf_options=pdf_options, profile_dir=profile_dir)
+    for (index, source, deal_name), outcome, failure, tries, seconds in supervise(
+            run, indexed, workers, chunk_size, hard_limit):
+        if failure is None:
+            outcome[2]["attempts"] = tries
+            yield (index, *outcome)
+            continue
+        label = f"{deal_name}/{source_name(source)}"
+        stats = {"file": label, "pages_parsed": 0, "page_count": None, "attempts": tries, "failure": failure,
+                 "seconds": round(seconds, 4), "bytes": _source_size(source)}
+        if hard_limit and seconds >= hard_limit:
+            stats["killed"] = True
+        yield index, None, f"Error processing {label}: {failure} ({tries} attempts)", stats
+
+def iter_results(tasks, stores=None, workers=None, chunk_size=None, timeout=None, early_exit=True,
+                 quarter=None, engine=None, progress=None, validate=None, profile_dir=None):
+    """Run process_pdf over (source, deal_name) pairs in supervised worker processes.
+
+    Tasks go to the workers in chunks, each file with its own wall-clock
+    limit, and ``(result, error, stats)`` is yielded for every task in task
+    order as soon as it and every earlier task are done. ``stores`` (a
+    BatchStores) are consulted before anything is run: a file unchanged in
+    the manifest reuses its row, a copy of a certificate dedup has seen is
+    yielded with no result or error and "copy_of" in its stats, a cache hit
+    is not parsed, and a quarantined file is an error without being run.
+    Records matching an earlier one's PAN, quarter and amounts are flagged
+    "DUPLICATE" with "duplicate_of". Failures go to quarantine, results to
+    the cache, and every file to metrics; the stores are saved or flushed
+    when the batch ends. Stats carry each file's "seconds" and, for files
+    hashed along the way, their SHA-256 under "digest".
+
+    ``progress(files_done, files_total, errors, flagged)`` is called as
+    files finish. ``validate(record)`` returns a record's error codes, kept
+    under "validation" in its stats and listed in ``flagged``. With
+    ``profile_dir`` files slower than profiling.PROFILE_THRESHOLD leave a
+    profile there. ``early_exit``, ``quarter`` and ``engine`` are passed on
+    to process_pdf.
+    """
+    cache, manifest, quarantine, dedup, metrics = stores or BatchStores()
+    workers = max(1, workers or DEFAULT_WORKERS)
+    timeout = DEFAULT_FILE_TIMEOUT if timeout is None else timeout
+    pdf_options = {"early_exit": early_exit, "quarter": quarter_number(quarter),
+                   "engine": check_engine(engine)}
+    indexed = [(i, source, deal_name) for i, (source, deal_name) in enumerate(tasks)]
+    outcomes = [None] * len(indexed)
+
+    pending = indexed
+    entries = {}
+    if manifest is not None:
+        unchanged, entries = manifest.match(indexed)
+        pending = []
+        for index, source, deal_name in indexed:
+            if index not in unchanged:
+                pending.append((index, source, deal_name))
+                continue
+            stats = {"file": f"{deal_name}/{source_name(source)}",
+                     "pages_parsed": 0, "page_count": None, "unchanged": True}
+            outcomes[index] = (unchanged[index], None, stats)
+
+    raw_digests = {}
+    if dedup is not None and pending:
+        raw_digests = {index: dedup.digest(source) for index, source, _ in pending}
+        still_pending = []
+        for index, source, deal_name in indexed:
+            digest = raw_digests.get(index)
+            if index in entries:
+                # Unchanged files count too, by the hash their manifest entry holds
+                digest = entries[index][3] = digest or entries[index][3]
+            label = f"{deal_name}/{source_name(source)}"
+            first = dedup.first_copy(digest, label)
+            if first is None:
+                if index in raw_digests:
+                    still_pending.append((index, source, deal_name))
+                continue
+            stats = {"file": label, "pages_parsed": 0, "page_count": None, "copy_of": first}
+            outcomes[index] = (None, None, stats)
+        pending = still_pending
+
+    digests = {}
+    if cache is not None and pending:
+        # Results depend on the targeted quarter and engine as well as on the bytes
+        suffix = f"/Q{pdf_options['quarter']}" if pdf_options['quarter'] else ""
+        if pdf_options['engine'] != 'pdfplumber':
+            suffix += f"/{pdf_options['engine']}"
+        for index, source, _ in pending:
+            if index not in raw_digests:
+                raw_digests[index] = cache.digest(source)
+            if index in entries:
+                entries[index][3] = raw_digests[index]
+        digests = {index: raw_digests[index] + suffix for index, _, _ in pending}
+        cached = cache.get_many(digests.values())
+        still_pending = []
+        for index, source, deal_name in pending:
+            hit = cached.get(digests[index])
+            if hit is None:
+                still_pending.append((index, source, deal_name))
+                continue
+            # PAN and deal come from the path, so only the totals are reused
+            result = dict(hit, **{
+                "PAN of deductee": extract_pan_from_filename(source_name(source)),
+                "Name of deal": deal_name,
+            })
+            stats = {"file": f"{deal_name}/{source_name(source)}",
+                     "pages_parsed": 0, "page_count": None, "cached": True}
+            outcomes[index] = (result, None, stats)
+        pending = still_pending
+
+    failed_before = {}
+    if quarantine is not None and pending:
+        for index, source, _ in pending:
+            if index not in raw_digests:
+                raw_digests[index] = quarantine.digest(source)
+        failed_before = quarantine.failures(raw_digests[index] for index, _, _ in pending)
+        blocked = quarantine.blocked(failed_before)
+        still_pending = []
+        for index, source, deal_name in pending:
+            if raw_digests[index] not in blocked:
+                still_pending.append((index, source, deal_name))
+                continue
+            label = f"{deal_name}/{source_name(source)}"
+            failures, reason = failed_before[raw_digests[index]]
+            stats = {"file": label, "pages_parsed": 0, "page_count": None, "quarantined": True}
+            outcomes[index] = (None, f"Quarantined {label}: {reason} in {failures} earlier runs", stats)
+        pending = still_pending
+
+    running_errors = []
+    flagged = []
+    released = 0
+    manifest_rows = []
+
+    def check(outcome):
+        result, _, stats = outcome
+        if validate is None or not result:
+            return
+        stats["validation"] = validate(result)
+        if stats["validation"]:
+            flagged.append(f"{stats['file']}: {', '.join(stats['validation'])}")
+
+    def release():
+        # Hand on finished outcomes without breaking task order
+        nonlocal released
+        while released < len(outcomes) and outcomes[released] is not None:
+            outcome = outcomes[released]
+            outcomes[released] = ()  # done with it; don't keep it alive
+            digest = raw_digests.get(released) or (entries[released][3] if released in entries else None)
+            if digest:
+                outcome[2]["digest"] = digest
+                if dedup is not None and not outcome[0] and not outcome[2].get("copy_of"):
+                    # Later copies of a file that failed are not skipped for it
+                    dedup.forget_copy(digest, outcome[2]["file"])
+            if dedup is not None and outcome[0]:
+                # In task order, so the first copy of a certificate is always the same one
+                stats = outcome[2]
+                first = dedup.first_record(outcome[0], pdf_options['quarter'], stats["file"])
+                if first is not None:
+                    stats["duplicate_of"] = first
+                    stats["validation"] = list(stats.get("validation") or ()) + ["DUPLICATE"]
+                    flagged.append(f"{stats['file']}: DUPLICATE of {first}")
+            if manifest is not None and outcome[0] and released in entries:
+                manifest_rows.append((indexed[released][1], entries[released], outcome[0]))
+            if metrics is not None:
+                metrics.record(*outcome)
+            released += 1
+            yield tuple(outcome)
+
+    for outcome in outcomes:
+        if outcome is not None:
+            check(outcome)
+            if outcome[1]:
+                running_errors.append(outcome[1])
+
+    files_done = len(indexed) - len(pending)
+    if progress is not None:
+        progress(files_done, len(indexed), running_errors, flagged)
+
+    fresh = []
+    try:
+        yield from release()
+        for index, *outcome in _run_chunks(pending, workers, chunk_size, timeout, pdf_options, profile_dir):
+            outcomes[index] = outcome
+            check(outcome)
+            if outcome[0] and index in digests:
+                fresh.append((digests[index], outcome[0]))
+            if quarantine is not None:
+                digest = raw_digests[index]
+                if "failure" in outcome[2]:
+                    quarantine.record_failure(digest, outcome[2]["file"], outcome[2]["failure"])
+                elif digest in failed_before:
+                    quarantine.clear([digest])
+            files_done += 1
+            if outcome[1]:
+                running_errors.append(outcome[1])
+            if progress is not None:
+                progress(files_done, len(indexed), running_errors, flagged)
+            yield from release()
+        if manifest is not None:
+            # Only a complete run may drop the files it didn't see
+            manifest.save(manifest_rows)
+    finally:
+        # Keep what was extracted even if the consumer stopped early
+        if cache is not None:
+            cache.put_many(fresh)
+        if metrics is not None:
+            metrics.flush()
+        if dedup is not None:
+            dedup.flush()
+        close_zip()
+
+def process_files(tasks, file_stats=None, sink=None, on_record=None, collect=True, **options):
+    """Run iter_results over ``tasks`` and collect the records.
+
+    Returns ``(data, processed_count, errors)``; when ``file_stats`` is a
+    list it is extended with one stats dict per file, in task order, and
+    each record's stats get its 1-based "row" in ``data``. ``sink``, if
+    given, gets each record through ``sink.write(record)`` as soon as it is
+    released, so output can be written while the batch runs; the write is
+    timed as the record's "csv_write" stage. ``on_record``, if given, is
+    then called as ``on_record(record, stats)`` for anything else that
+    follows the records as they are written. With ``collect=False`` the
+    records are not kept (``data`` comes back empty, rows are still
+    numbered), so a large batch holds no more than its stats. Other
+    ``options`` are passed on to iter_results.
+    """
+    tasks = list(tasks)
+    metrics = (options.get('stores') or BatchStores()).metrics
+    data = []
+    processed_count = 0
+    errors = []
+    # The generator goes first so zip runs it to completion (and its cleanup)
+    for (result, error, stats), (source, deal_name) in zip(iter_results(tasks, **options), tasks):
+        if result:
+            processed_count += 1
+            stats["row"] = processed_count
+            if collect:
+                data.append(result)
+            if sink is not None:
+                start = time.perf_counter()
+                sink.write(result)
+                seconds = _timed(stats.setdefault('timings', {}), 'csv_write', start) - start
+                if metrics is not None:
+                    metrics.observe('csv_write', seconds)
+            if on_record is not None:
+                on_record(result, stats)
+            print(f"Processed: {deal_name}/{source_name(source)}")
+        elif stats.get("copy_of"):
+            print(f"Skipped: {deal_name}/{source_name(source)} is a copy of {stats['copy_of']}")
+        else:
+            errors.append(error)
+        if file_stats is not None:
+            file_stats.append(stats)
+
+    return data, processed_count, errors
+
+def process_directory(base_dir, **options):
+    return process_files(find_pdf_files(base_dir), **options)
+
+def process_zip(zip_path, **options):
+    return process_files(find_zip_members(zip_path), **options)
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import time
+
+from extraction import extractor_fingerprint, open_source_stream
+from storage import open_database, transaction
+
+# Results kept before the least recently used are evicted
+DEFAULT_MAX_ENTRIES = int(os.environ.get('TDS_CACHE_MAX_ENTRIES', 200000))
+# Days a result may go unused before it is evicted
+DEFAULT_MAX_AGE_DAYS = float(os.environ.get('TDS_CACHE_MAX_AGE_DAYS', 400))
+
+def file_digest(source):
+    """SHA-256 of the bytes of a path or ZipMember."""
+    digest = hashlib.sha256()
+    with open_source_stream(source) as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ExtractionCache:
+    """SQLite store of process_pdf results keyed by PDF content.
+
+    Entries are keyed by the SHA-256 of the PDF plus the extractor
+    fingerprint, so a changed regex or EXTRACTOR_VERSION never serves stale
+    totals. The fingerprint is taken again on every lookup, since layout
+    templates can be edited while the app is running. Entries unused for
+    ``max_age_days`` are dropped, and beyond ``max_entries`` the least
+    recently used go first. Hit and miss counts are kept in the database
+    so every gunicorn worker reports the same numbers.
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        open_database(path)
+
+        with transaction(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " digest TEXT NOT NULL, version TEXT NOT NULL, result TEXT NOT NULL,"
+                " created_at REAL NOT NULL, last_used REAL NOT NULL,"
+                " PRIMARY KEY (digest, version))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters ("
+                         " name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.executemany("INSERT OR IGNORE INTO counters VALUES (?, 0)", [("hits",), ("misses",)])
+            # Results from any other extractor version can never be served again
+            conn.execute("DELETE FROM results WHERE version != ?", (self.version,))
+
+    @property
+    def version(self):
+        return extractor_fingerprint()
+
+    def digest(self, source):
+        return file_digest(source)
+
+    def get_many(self, digests):
+        """Return {digest: result} for the digests that are cached."""
+        digests = list(set(digests))
+        found = {}
+        now = time.time()
+        version = self.version
+        with transaction(self.path) as conn:
+            for start in range(0, len(digests), 500):
+                batch = digests[start:start + 500]
+                marks = ','.join('?' * len(batch))
+                rows = conn.execute(
+                    f"SELECT digest, result FROM results WHERE version = ? AND digest IN ({marks})",
+                    [version, *batch],
+                ).fetchall()
+                found.update((digest, json.loads(result)) for digest, result in rows)
+            if found:
+                conn.executemany(
+                    "UPDATE results SET last_used = ? WHERE digest = ? AND version = ?",
+                    [(now, digest, version) for digest in found],
+                )
+            conn.execute("UPDATE counters SET value = value + ? WHERE name = 'hits'", (len(found),))
+            conn.execute("UPDATE counters SET value = value + ? WHERE name = 'misses'",
+                         (len(digests) - len(found),))
+        return found
+
+    def get(self, digest):
+        return self.get_many([digest]).get(digest)
+
+    def put_many(self, items):
+        """Store (digest, result) pairs, then apply the eviction limits."""
+        now = time.time()
+        version = self.version
+        with transaction(self.path) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                [(digest, version, json.dumps(result), now, now) for digest, result in items],
+            )
+            self._evict(conn, now)
+
+    def put(self, digest, result):
+        self.put_many([(digest, result)])
+
+    def _evict(self, conn, now):
+        if self.max_age_days:
+            conn.execute("DELETE FROM results WHERE last_used < ?",
+                         (now - self.max_age_days * 86400,))
+        if self.max_entries:
+            conn.execute(
+                "DELETE FROM results WHERE rowid IN ("
+                " SELECT rowid FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def stats(self):
+        with transaction(self.path) as conn:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            entries = conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "entries": entries,
+            "version": self.version,
+        }
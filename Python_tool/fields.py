@@ -0,0 +1,171 @@
+"""Declarative field extraction for Form 16A certificate text.
+
+Every landmark the extractors care about is one alternative of a single
+compiled pattern, so a document is scanned once no matter how many fields
+are read from it. Each field is then resolved from the landmarks found by
+its rules, tried in order.
+"""
+import hashlib
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+AMOUNT = r"[\d,]+\.\d{2}"
+
+# Landmarks in the text: name -> pattern. Capture groups are named
+# <landmark>_<value> so they stay unique inside the combined pattern. Each
+# pattern starts with a literal character, which lets the regex engine skip
+# ahead to candidate positions instead of trying every landmark everywhere.
+TOKENS = {
+    'summary': r"Summary of payment",
+    'quarter_row': rf"Q(?P<quarter_row_quarter>[1-4])\s+\w+\s+"
+                   rf"(?P<quarter_row_deducted>{AMOUNT})\s+(?P<quarter_row_deposited>{AMOUNT})",
+    'total': rf"Total \(Rs\.\)\s+(?P<total_amount>{AMOUNT})",
+}
+
+# The empty group closing each alternative names the landmark via lastgroup
+TOKEN_PATTERN = re.compile('|'.join(f"(?:{pattern})(?P<{name}>)" for name, pattern in TOKENS.items()))
+
+PAN_PATTERN = re.compile(r"[A-Z]{5}[0-9]{4}[A-Z]")
+
+# Take ``group`` from the ``occurrence``-th ``token`` (1-based), counting
+# only those after the first ``after`` landmark and, with ``where`` set to a
+# (group, value) pair, only those whose group holds that value. A field
+# resolved by the rule is reported with the rule's ``confidence``.
+Rule = namedtuple('Rule', ['token', 'group', 'occurrence', 'after', 'where', 'confidence'],
+                  defaults=(1, None, None, 'high'))
+FieldSpec = namedtuple('FieldSpec', ['name', 'rules'])
+
+def quarter_number(label):
+    """'1'..'4' for a quarter label such as 'FY 2024-25 Q2', else None."""
+    if label in ('1', '2', '3', '4'):
+        return label
+    match = re.search(r"\bQ([1-4])\b", label or "", re.IGNORECASE)
+    return match.group(1) if match else None
+
+@lru_cache(maxsize=None)
+def build_fields(quarter=None):
+    """Field specs, targeting the quarterly row of ``quarter`` ('1'..'4') if given."""
+    if quarter:
+        tds_rules = (
+            # Tax deducted column of the row for the quarter being processed
+            Rule('quarter_row', 'quarter_row_deducted', where=('quarter_row_quarter', quarter)),
+            # The summary-of-tax table total is the second total on the form
+            Rule('total', 'total_amount', occurrence=2, confidence='medium'),
+            # A row for some other quarter: most likely the wrong quarter was entered
+            Rule('quarter_row', 'quarter_row_deducted', confidence='low'),
+        )
+    else:
+        tds_rules = (
+            Rule('quarter_row', 'quarter_row_deducted'),
+            Rule('total', 'total_amount', occurrence=2, confidence='medium'),
+        )
+    return (
+        FieldSpec("Total Amount paid", (
+            # First total after the summary-of-payment table heading
+            Rule('total', 'total_amount', after='summary'),
+        )),
+        FieldSpec("Total TDS", tds_rules),
+    )
+
+FIELDS = build_fields()
+
+# Unmatched text carried from one feed to the next, for a landmark split
+# across them; every landmark is far shorter
+TAIL_LIMIT = 1000
+
+def parse_amount(value):
+    return float(value.replace(',', ''))
+
+def spec_fingerprint():
+    """Short hash of the patterns and rules, for invalidating cached results."""
+    specs = [build_fields(quarter) for quarter in (None, '1', '2', '3', '4')]
+    return hashlib.sha256(repr((TOKENS, specs)).encode()).hexdigest()[:16]
+
+class FieldScanner:
+    """Incrementally collect landmarks from text and resolve FIELDS.
+
+    Text can be fed page by page; each feed must end on a line break so a
+    landmark is never split across two feeds. Rules are resolved as their
+    landmarks go by, and scanning stops as soon as every field is resolved
+    by its first (best) rule, so the rest of a long document is never looked
+    at. Fields left to a fallback rule keep the scan going to the end.
+    """
+
+    def __init__(self, fields=FIELDS):
+        self.fields = fields
+        self._found = {}
+        self._unresolved = len(fields)
+        self._tail = ""
+        # landmark -> [rule, field, anchor seen, landmarks counted] for every
+        # rule that landmark can move forward
+        self._watchers = {}
+        for field in fields:
+            for rule in field.rules:
+                progress = [rule, field, rule.after is None, 0]
+                self._watchers.setdefault(rule.token, []).append(progress)
+                if rule.after is not None:
+                    self._watchers.setdefault(rule.after, []).append(progress)
+
+    def feed(self, text):
+        if not self._unresolved:
+            return
+        self._tail += text
+        end = 0
+        for match in TOKEN_PATTERN.finditer(self._tail):
+            end = match.end()
+            self._add(match.lastgroup, match)
+            if not self._unresolved:
+                # Nothing left to find; drop the rest without copying it
+                self._tail = ""
+                return
+        # Pages without landmarks must not pile up (and be rescanned) here
+        self._tail = self._tail[end:][-TAIL_LIMIT:]
+
+    def _add(self, token, match):
+        for progress in self._watchers.get(token, ()):
+            rule, field = progress[0], progress[1]
+            if rule in self._found:
+                continue
+            if token == rule.after:
+                progress[2] = True
+            elif progress[2] and (rule.where is None or match.group(rule.where[0]) == rule.where[1]):
+                progress[3] += 1
+                if progress[3] == rule.occurrence:
+                    self._found[rule] = parse_amount(match.group(rule.group))
+                    if rule is field.rules[0]:
+                        self._unresolved -= 1
+
+    def _best(self, field):
+        for rule in field.rules:
+            if rule in self._found:
+                return rule
+        return None
+
+    def value(self, field):
+        rule = self._best(field)
+        return self._found[rule] if rule else None
+
+    def values(self):
+        return {field.name: self.value(field) for field in self.fields}
+
+    def confidences(self):
+        """{field name: confidence of the rule that resolved it, or None}."""
+        confidences = {}
+        for field in self.fields:
+            rule = self._best(field)
+            confidences[field.name] = rule.confidence if rule else None
+        return confidences
+
+    def complete(self):
+        return not self._unresolved
+
+def extract_fields(text, fields=FIELDS):
+    """Resolve every field in ``fields`` from ``text`` in a single scan."""
+    scanner = FieldScanner(fields)
+    scanner.feed(text)
+    return scanner.values()
+
+def extract_pan_from_filename(filename):
+    match = PAN_PATTERN.search(filename)
+    return match.group(0) if match else None
@@ -0,0 +1,25 @@
+"""gunicorn settings for the web service, read from the working directory.
+
+The app is imported once in the master and forked into the workers, which
+share its modules copy-on-write. The PDF and table libraries are loaded in
+the master too, before any worker is forked (see extraction.warm_up), so
+they are shared the same way instead of loaded once per worker. gunicorn
+takes the port and worker count from PORT and WEB_CONCURRENCY; each job
+runs TDS_WORKERS extraction processes on top of those.
+"""
+import os
+
+preload_app = True
+
+# Extraction processes each job starts (see extraction.DEFAULT_WORKERS). Set
+# here, before the app is imported, so a host's CPU count never decides how
+# many pdfplumber processes a small instance forks
+os.environ.setdefault('TDS_WORKERS', '2')
+
+# Load the PDF libraries in the master; off, each worker loads them on its first job
+WARM_IMPORTS = os.environ.get('TDS_WARM_IMPORTS', '1').lower() in ('1', 'true', 'on')
+
+def on_starting(server):
+    if WARM_IMPORTS:
+        from extraction import warm_up
+        warm_up()
@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import open_database, transaction
+
+# Jobs each web worker runs at once
+DEFAULT_RUNNERS = int(os.environ.get('TDS_JOB_RUNNERS', 1))
+# A job that has not reported progress for this long lost its worker; jobs
+# waiting for a runner are kept fresh by the jobs running ahead of them
+STALE_AFTER = float(os.environ.get('TDS_JOB_STALE_AFTER', 900))
+# Minimum seconds between progress writes to the database
+PROGRESS_INTERVAL = 0.5
+
+class JobQueue:
+    """Background extraction jobs with status kept in SQLite.
+
+    Jobs run on a small thread pool inside the web worker that accepted
+    them, while their progress lives in the database, so a status poll
+    answered by any gunicorn worker sees the same numbers. Each progress
+    write also refreshes the jobs still queued behind it, so only a worker
+    that died makes them stale.
+    """
+
+    def __init__(self, path, runners=DEFAULT_RUNNERS):
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers=runners, thread_name_prefix='tds-job')
+        self._queued = set()
+        self._queued_lock = threading.Lock()
+        open_database(path)
+
+        with transaction(path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, kind TEXT, status TEXT NOT NULL,"
+                " files_done INTEGER NOT NULL DEFAULT 0, files_total INTEGER,"
+                " errors TEXT NOT NULL DEFAULT '[]', result TEXT, error TEXT,"
+                " created_at REAL NOT NULL, started_at REAL, updated_at REAL NOT NULL,"
+                " finished_at REAL, flagged TEXT NOT NULL DEFAULT '[]')"
+            )
+            # Stores created before records were validated during the run
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if 'flagged' not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN flagged TEXT NOT NULL DEFAULT '[]'")
+
+    def submit(self, fn, *args, kind=None, **kwargs):
+        """Queue ``fn(progress, *args, **kwargs)`` and return the new job id.
+
+        ``progress(files_done, files_total, errors, flagged=())`` records how
+        far the job got, with ``flagged`` listing files whose records failed
+        validation so far; whatever ``fn`` returns must be JSON serialisable
+        and becomes the job's result.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with transaction(self.path) as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?)",
+                (job_id, kind, now, now),
+            )
+        with self._queued_lock:
+            self._queued.add(job_id)
+        self._executor.submit(self._run, job_id, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, fn, args, kwargs):
+        with self._queued_lock:
+            self._queued.discard(job_id)
+        now = time.time()
+        self._update(job_id, status='running', started_at=now, updated_at=now)
+        self._touch_queued(now)
+        last_write = [0.0]
+
+        def progress(files_done, files_total, errors, flagged=()):
+            now = time.time()
+            if files_done < files_total and now - last_write[0] < PROGRESS_INTERVAL:
+                return
+            last_write[0] = now
+            self._update(job_id, files_done=files_done, files_total=files_total,
+                         errors=json.dumps(list(errors)), flagged=json.dumps(list(flagged)),
+                         updated_at=now)
+            self._touch_queued(now)
+
+        try:
+            result = fn(progress, *args, **kwargs)
+        except Exception as e:
+            traceback.print_exc()
+            now = time.time()
+            self._update(job_id, status='failed', error=str(e), updated_at=now, finished_at=now)
+            return
+        now = time.time()
+        self._update(job_id, status='done', result=json.dumps(result), updated_at=now, finished_at=now)
+
+    def _update(self, job_id, **fields):
+        assignments = ', '.join(f"{name} = ?" for name in fields)
+        with transaction(self.path) as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def _touch_queued(self, now):
+        """Mark the jobs waiting for one of this queue's runners as still alive."""
+        with self._queued_lock:
+            queued = list(self._queued)
+        if not queued:
+            return
+        with transaction(self.path) as conn:
+            conn.executemany("UPDATE jobs SET updated_at = ? WHERE id = ? AND status = 'queued'",
+                             [(now, job_id) for job_id in queued])
+
+    def get(self, job_id):
+        """Return the job's status as a dict, or None for an unknown id."""
+        with transaction(self.path) as conn:
+            conn.row_factory = lambda cursor, row: {
+                column[0]: value for column, value in zip(cursor.description, row)
+            }
+            job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if job is None:
+            return None
+
+        now = time.time()
+        if job['status'] in ('queued', 'running') and now - job['updated_at'] > STALE_AFTER:
+            job['status'] = 'failed'
+            job['error'] = "The worker running this job stopped responding"
+            with transaction(self.path) as conn:
+                conn.execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ?"
+                             " WHERE id = ? AND status = ?", (job['error'], now, job_id, job['status']))
+
+        errors = json.loads(job['errors'])
+        flagged = json.loads(job['flagged'])
+        elapsed = None
+        throughput = None
+        eta = None
+        if job['started_at']:
+            elapsed = (job['finished_at'] or now) - job['started_at']
+            if elapsed > 0 and job['files_done']:
+                throughput = job['files_done'] / elapsed
+                if job['files_total'] is not None and job['status'] == 'running':
+                    eta = (job['files_total'] - job['files_done']) / throughput
+
+        return {
+            "id": job['id'],
+            "kind": job['kind'],
+            "status": job['status'],
+            "files_done": job['files_done'],
+            "files_total": job['files_total'],
+            "error_count": len(errors),
+            "errors": errors,
+            "flagged_count": len(flagged),
+            "flagged": flagged,
+            "elapsed_seconds": elapsed,
+            "throughput": throughput,
+            "eta_seconds": eta,
+            "result": json.loads(job['result']) if job['result'] else None,
+            "error": job['error'],
+        }
@@ -0,0 +1,185 @@
+"""Layout templates: where the fields sit on each version of the certificate.
+
+A template names a certificate layout, the page size and a few anchor
+lines that identify it on the first page (each with the box it must be
+found in), and the regions of that page holding the summary-of-payment
+and quarterly TDS tables. process_pdf extracts only those regions when the
+first page matches a template, and the whole text otherwise.
+
+Templates are learned from a sample certificate of each layout:
+
+    python layouts.py learn sample.pdf "TRACES 2024"
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+from collections import namedtuple
+
+# JSON file the learned templates are stored in
+LAYOUTS_FILE = os.environ.get('TDS_LAYOUTS_FILE',
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), 'layouts.json'))
+
+# Points of play allowed around anchors and page sizes
+ANCHOR_TOLERANCE = 3
+# Extra height given to each region, as a share of the page, so a table a
+# few rows longer or shorter than the sample's still falls inside it
+REGION_SLACK = 0.08
+
+# anchors: [(text, [x0, top, x1, bottom]), ...]; regions: [[x0, top, x1, bottom], ...]
+Layout = namedtuple('Layout', ['name', 'page_size', 'anchors', 'regions'])
+
+_loaded = {}
+_fingerprints = {}
+
+def load_layouts(path=None):
+    """Templates stored in ``path`` (none if it doesn't exist), re-read when it changes."""
+    path = path or LAYOUTS_FILE
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return ()
+    if _loaded.get(path, (None,))[0] != mtime:
+        with open(path) as f:
+            layouts = tuple(Layout(**entry) for entry in json.load(f))
+        _loaded[path] = (mtime, layouts)
+    return _loaded[path][1]
+
+def layouts_fingerprint(path=None):
+    """Short hash of the stored templates ('' without any), for cache invalidation.
+
+    Re-hashed only when the file changes, so it is cheap to ask per lookup.
+    """
+    path = path or LAYOUTS_FILE
+    try:
+        mtime = os.path.getmtime(path)
+        if _fingerprints.get(path, (None,))[0] != mtime:
+            with open(path, 'rb') as f:
+                _fingerprints[path] = (mtime, hashlib.sha256(f.read()).hexdigest()[:16])
+    except OSError:
+        return ''
+    return _fingerprints[path][1]
+
+# Characters closer than this (in points) belong to the same line / word,
+# as in pdfplumber's extract_text
+LINE_TOLERANCE = 3
+WORD_GAP = 3
+
+def page_chars(page):
+    """(top, x0, x1, bottom, text) of every character on a pdfplumber page.
+
+    Read straight from pdfminer's layout: pdfplumber's own ``chars`` (which
+    crop and within_bbox filter) converts every attribute of every
+    character first, and that costs more than the rest of a region read.
+    """
+    from pdfminer.layout import LTChar, LTContainer
+
+    chars = []
+    stack = [page.layout]
+    while stack:
+        for item in stack.pop():
+            if isinstance(item, LTChar):
+                chars.append((page.height - item.y1, item.x0, item.x1, page.height - item.y0, item.get_text()))
+            elif isinstance(item, LTContainer):
+                stack.append(item)
+    return chars
+
+def bbox_text(chars, bbox):
+    """Text of the characters centred inside ``bbox``, one line per row."""
+    x0, top, x1, bottom = bbox
+    inside = sorted(char for char in chars
+                    if x0 <= (char[1] + char[2]) / 2 <= x1 and top <= (char[0] + char[3]) / 2 <= bottom)
+    rows = []
+    for char in inside:
+        if rows and char[0] - rows[-1][0][0] <= LINE_TOLERANCE:
+            rows[-1].append(char)
+        else:
+            rows.append([char])
+
+    lines = []
+    for row in rows:
+        words = []
+        word = ""
+        last_x1 = None
+        for _, char_x0, char_x1, _, text in sorted(row, key=lambda char: char[1]):
+            if text.isspace() or (last_x1 is not None and char_x0 - last_x1 > WORD_GAP):
+                if word:
+                    words.append(word)
+                word = ""
+            if not text.isspace():
+                word += text
+            last_x1 = char_x1
+        if word:
+            words.append(word)
+        lines.append(" ".join(words))
+    return "\n".join(lines)
+
+def _squash(text):
+    return re.sub(r"\s+", " ", text or "").strip()
+
+def match_layout(chars, page_size, layouts):
+    """The first template whose page size and anchors fit a page's ``chars``, or None."""
+    for layout in layouts:
+        if any(abs(actual - expected) > ANCHOR_TOLERANCE for actual, expected in zip(page_size, layout.page_size)):
+            continue
+        for text, (x0, top, x1, bottom) in layout.anchors:
+            box = (x0 - ANCHOR_TOLERANCE, top - ANCHOR_TOLERANCE, x1 + ANCHOR_TOLERANCE, bottom + ANCHOR_TOLERANCE)
+            if _squash(text) not in _squash(bbox_text(chars, box)):
+                break
+        else:
+            return layout
+    return None
+
+def region_texts(chars, layout):
+    """Yield the text of each region of ``layout`` from a page's ``chars``."""
+    for bbox in layout.regions:
+        yield bbox_text(chars, bbox)
+
+def learn_layout(pdf_path, name):
+    """Build a template from the first page of a sample certificate.
+
+    The anchor is the form's title line; the region runs from the
+    "Summary of payment" heading to the total of the quarterly TDS table,
+    across the full width of the page.
+    """
+    import pdfplumber
+
+    with pdfplumber.open(pdf_path) as pdf:
+        page = pdf.pages[0]
+        lines = page.extract_text_lines()
+        if not lines:
+            raise ValueError(f"No text on the first page of {pdf_path}")
+
+        summary = next((i for i, line in enumerate(lines) if line['text'].startswith("Summary of payment")), None)
+        totals = [i for i, line in enumerate(lines)
+                  if summary is not None and i > summary and line['text'].startswith("Total (Rs.)")]
+        if summary is None or len(totals) < 2:
+            raise ValueError(f"{pdf_path} doesn't show both summary tables on its first page")
+
+        title = lines[0]
+        slack = page.height * REGION_SLACK
+        region = [0, lines[summary]['top'] - slack, page.width, lines[totals[1]]['bottom'] + slack]
+        return Layout(
+            name=name,
+            page_size=[page.width, page.height],
+            anchors=[(title['text'], [title['x0'], title['top'], title['x1'], title['bottom']])],
+            regions=[[round(value, 2) for value in region]],
+        )
+
+def save_layout(layout, path=None):
+    """Add ``layout`` to the stored templates, replacing one of the same name."""
+    path = path or LAYOUTS_FILE
+    layouts = [other for other in load_layouts(path) if other.name != layout.name]
+    layouts.append(layout)
+    with open(path + '.tmp', 'w') as f:
+        json.dump([entry._asdict() for entry in layouts], f, indent=2)
+    os.replace(path + '.tmp', path)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] != 'learn':
+        print("Usage: python layouts.py learn <sample.pdf> <layout name>")
+        sys.exit(1)
+    learned = learn_layout(sys.argv[2], sys.argv[3])
+    save_layout(learned)
+    print(f"Saved layout '{learned.name}' to {LAYOUTS_FILE}")
@@ -0,0 +1,290 @@
+"""Every quarter's extracted rows in one SQLite ledger, indexed for lookups.
+
+/process adds each run's records under its quarter, one row per
+certificate (keyed by the SHA-256 of the PDF), so re-running a quarter
+replaces its rows instead of double counting, while two certificates for
+one PAN and deal both count. Quarter labels are read as a fiscal year and
+quarter number, so "Q1 FY24" and "FY 2023-24 Q1" are the same quarter; a
+label that can't be read is refused. Totals for a PAN or a deal, over all
+years or one fiscal year, are index lookups instead of reading every
+quarter's CSV; the CSV (or any output format) of a quarter or year is
+written from here on demand. Run from the Python_tool directory:
+
+    python ledger.py pan ABCDE1234F --year 2024-25
+    python ledger.py deal "Deal 001"
+    python ledger.py quarters
+    python ledger.py export "FY 2024-25 Q3.csv" --quarter "FY 2024-25 Q3"
+    python ledger.py import "FY 2024-25 Q3" "FY 2024-25 Q3.csv"
+"""
+import argparse
+import json
+import os
+import re
+import tempfile
+import time
+
+from fields import quarter_number
+from outputs import ROW_GROUP_SIZE, format_for_path, open_writer, read_groups
+from storage import open_database, transaction
+
+# Default ledger file, next to the app's other output; TDS_LEDGER_FILE moves it
+LEDGER_FILE = os.environ.get('TDS_LEDGER_FILE') or os.path.join(
+    os.environ.get('OUTPUT_FOLDER', os.path.join(tempfile.gettempdir(), 'output')), 'ledger.sqlite3')
+
+# Ledger column for each record key, in output column order
+RECORD_COLUMNS = (
+    ("PAN of deductee", "pan"),
+    ("Total Amount paid", "amount_paid"),
+    ("Total TDS", "tds"),
+    ("Name of deal", "deal"),
+    ("Total Amount paid confidence", "paid_confidence"),
+    ("Total TDS confidence", "tds_confidence"),
+)
+
+def fiscal_year(label):
+    """'2024-25' for labels such as 'FY 2024-25 Q2', 'Q2 2024-2025' or 'Q2 FY25', else None."""
+    label = label or ""
+    match = re.search(r"\b(\d{4})\s*[-/]\s*(\d{2}|\d{4})\b", label)
+    if match:
+        start, end = int(match.group(1)), int(match.group(2)) % 100
+        return f"{start}-{end:02d}" if end == (start + 1) % 100 else None
+    # "FY25" / "FY 2025" name the year the fiscal year ends in
+    match = re.search(r"\bFY\s*'?(\d{4}|\d{2})\b", label, re.IGNORECASE)
+    if match:
+        end = int(match.group(1))
+        end = end if end > 99 else 2000 + end
+        return f"{end - 1}-{end % 100:02d}"
+    return None
+
+def parse_quarter(label):
+    """(fiscal year, quarter number) of a label, e.g. ('2024-25', 3) for 'Q3 FY25'.
+
+    Raises ValueError for a label missing either.
+    """
+    year, number = fiscal_year(label), quarter_number(label)
+    if not year or not number:
+        raise ValueError(f"Can't read a fiscal year and quarter from '{label}', use e.g. 'FY 2024-25 Q3'")
+    return year, int(number)
+
+def quarter_label(year, number):
+    return f"FY {year} Q{number}"
+
+def certificate_key(stats):
+    """Ledger key of the certificate behind a file's stats: its SHA-256, else its file name."""
+    return stats.get("digest") or f"file:{stats['file']}"
+
+def _year(year):
+    if not year:
+        return None
+    # A bare "2025" or "25" is read like "FY25"
+    parsed = fiscal_year(year) or fiscal_year(f"FY {year}")
+    if parsed is None:
+        raise ValueError(f"Can't read a fiscal year from '{year}', use e.g. 2024-25")
+    return parsed
+
+def _amount(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if value != value else value  # NaN counts as missing
+
+def _sums(rows, paid, tds):
+    return {"rows": rows, "amount_paid": paid, "tds": tds}
+
+class Ledger:
+    def __init__(self, path=LEDGER_FILE):
+        self.path = path
+        open_database(path)
+        with transaction(self.path) as conn:
+            # The primary key doubles as the quarter index
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS certificates ("
+                " fiscal_year TEXT NOT NULL, quarter INTEGER NOT NULL, certificate TEXT NOT NULL,"
+                " pan TEXT, deal TEXT, amount_paid REAL, tds REAL, paid_confidence TEXT, tds_confidence TEXT,"
+                " updated_at REAL NOT NULL, PRIMARY KEY (fiscal_year, quarter, certificate))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS certificates_pan ON certificates (pan, fiscal_year)")
+            conn.execute("CREATE INDEX IF NOT EXISTS certificates_deal ON certificates (deal, fiscal_year)")
+
+    def append(self, rows, quarter):
+        """Add ``(certificate, record)`` pairs under ``quarter``; return how many were stored.
+
+        ``certificate`` identifies the PDF a record came from (see
+        certificate_key); a record replaces the row its certificate already
+        had in the quarter. Records without a PAN are kept too, so exports
+        match the run's output, but no PAN lookup finds them. Raises
+        ValueError if ``quarter`` can't be read (see parse_quarter).
+        """
+        year, number = parse_quarter(quarter)
+        now = time.time()
+        values = [(year, number, certificate, (record.get("PAN of deductee") or None), record.get("Name of deal"),
+                   _amount(record.get("Total Amount paid")), _amount(record.get("Total TDS")),
+                   record.get("Total Amount paid confidence"), record.get("Total TDS confidence"), now)
+                  for certificate, record in rows]
+        with transaction(self.path) as conn:
+            conn.executemany("INSERT OR REPLACE INTO certificates VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", values)
+        return len(values)
+
+    def writer(self, quarter):
+        """LedgerWriter adding a run's records under ``quarter`` as they are written."""
+        return LedgerWriter(self, quarter)
+
+    def _totals(self, column, value, year):
+        year = _year(year)
+        where = f"{column} = ?" + (" AND fiscal_year = ?" if year else "")
+        params = [value, year] if year else [value]
+        group = "deal" if column == "pan" else "pan"
+        sums = "COUNT(*), ROUND(SUM(amount_paid), 2), ROUND(SUM(tds), 2)"
+        with transaction(self.path) as conn:
+            total = conn.execute(f"SELECT {sums} FROM certificates WHERE {where}", params).fetchone()
+            by_quarter = conn.execute(
+                f"SELECT fiscal_year, quarter, {sums} FROM certificates WHERE {where}"
+                " GROUP BY fiscal_year, quarter ORDER BY fiscal_year, quarter", params
+            ).fetchall()
+            by_group = conn.execute(
+                f"SELECT {group}, {sums} FROM certificates WHERE {where}"
+                f" GROUP BY {group} ORDER BY {group}", params
+            ).fetchall()
+        return {
+            column: value,
+            "fiscal_year": year,
+            **_sums(*total),
+            "by_quarter": [{"quarter": quarter_label(fy, number), **_sums(*sums)}
+                           for fy, number, *sums in by_quarter],
+            f"by_{group}": [{group: name, **_sums(*sums)} for name, *sums in by_group],
+        }
+
+    def pan_totals(self, pan, year=None):
+        """Amounts paid and TDS for one PAN, in total, by quarter and by deal."""
+        return self._totals("pan", pan.upper(), year)
+
+    def deal_totals(self, deal, year=None):
+        """Amounts paid and TDS for one deal, in total, by quarter and by PAN."""
+        return self._totals("deal", deal, year)
+
+    def quarters(self):
+        """Every quarter in the ledger with its row count, totals and rows without a PAN."""
+        with transaction(self.path) as conn:
+            rows = conn.execute(
+                "SELECT fiscal_year, quarter, COUNT(*), ROUND(SUM(amount_paid), 2), ROUND(SUM(tds), 2),"
+                " SUM(pan IS NULL) FROM certificates GROUP BY fiscal_year, quarter ORDER BY fiscal_year, quarter"
+            ).fetchall()
+        return [{"quarter": quarter_label(year, number), "fiscal_year": year, **_sums(count, paid, tds),
+                 "without_pan": without_pan}
+                for year, number, count, paid, tds, without_pan in rows]
+
+    def records(self, quarter=None, year=None):
+        """Iterate over the stored rows as extracted records, by quarter, deal and PAN.
+
+        Raises ValueError straight away for a quarter or year that can't be read.
+        """
+        where, params = [], []
+        if quarter:
+            where.append("fiscal_year = ? AND quarter = ?")
+            params.extend(parse_quarter(quarter))
+        if year:
+            where.append("fiscal_year = ?")
+            params.append(_year(year))
+        return self._records(" WHERE " + " AND ".join(where) if where else "", params)
+
+    def _records(self, where, params):
+        columns = ", ".join(column for _, column in RECORD_COLUMNS)
+        with transaction(self.path) as conn:
+            cursor = conn.execute(
+                f"SELECT {columns} FROM certificates{where}"
+                " ORDER BY fiscal_year, quarter, deal, pan, certificate", params
+            )
+            for row in cursor:
+                yield {key: value for (key, _), value in zip(RECORD_COLUMNS, row)}
+
+    def export(self, path, quarter=None, year=None, name=None):
+        """Write the rows of ``quarter`` and/or ``year`` (else all) to an output file; return the count."""
+        count = 0
+        records = self.records(quarter, year)
+        with open_writer(path, name or format_for_path(path)) as writer:
+            for record in records:
+                writer.write(record)
+                count += 1
+        return count
+
+    def import_file(self, path, quarter):
+        """Add the rows of an earlier run's output file under ``quarter``.
+
+        Rows are keyed by file name and row number, so importing the same
+        file again replaces them.
+        """
+        parse_quarter(quarter)  # refuse an unreadable quarter before reading the file
+        stored = 0
+        name = os.path.basename(path)
+        for df in read_groups(path):
+            records = df.astype(object).where(df.notna(), None).to_dict('records')
+            keys = (f"import:{name}:{row}" for row in range(stored + 1, stored + len(records) + 1))
+            stored += self.append(zip(keys, records), quarter)
+        return stored
+
+class LedgerWriter:
+    """Add ``(certificate, record)`` pairs to a ledger a batch at a time.
+
+    Raises ValueError on creation for a quarter the ledger can't read, so
+    a run knows before it starts.
+    """
+
+    def __init__(self, ledger, quarter, batch_size=ROW_GROUP_SIZE):
+        self.ledger = ledger
+        self.quarter = quarter
+        self.batch_size = batch_size
+        self.rows = 0
+        self._buffer = []
+        parse_quarter(quarter)
+
+    def write(self, certificate, record):
+        self._buffer.append((certificate, record))
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.rows += self.ledger.append(self._buffer, self.quarter)
+            self._buffer = []
+
+    def close(self):
+        self.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', default=LEDGER_FILE, help="ledger file (default: %(default)s)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    for command in ('pan', 'deal'):
+        sub = commands.add_parser(command, help=f"totals for one {command.upper() if command == 'pan' else command}")
+        sub.add_argument('name')
+        sub.add_argument('--year', help="fiscal year, e.g. 2024-25")
+    commands.add_parser('quarters', help="row counts and totals per quarter")
+    export = commands.add_parser('export', help="write rows to a .csv, .csv.gz, .csv.zst, .parquet or .xlsx file")
+    export.add_argument('output')
+    export.add_argument('--quarter')
+    export.add_argument('--year')
+    load = commands.add_parser('import', help="add an earlier run's output file under a quarter")
+    load.add_argument('quarter')
+    load.add_argument('files', nargs='+')
+    args = parser.parse_args()
+
+    ledger = Ledger(args.db)
+    try:
+        if args.command == 'pan':
+            print(json.dumps(ledger.pan_totals(args.name, args.year), indent=2))
+        elif args.command == 'deal':
+            print(json.dumps(ledger.deal_totals(args.name, args.year), indent=2))
+        elif args.command == 'quarters':
+            print(json.dumps(ledger.quarters(), indent=2))
+        elif args.command == 'export':
+            count = ledger.export(args.output, args.quarter, args.year)
+            print(f"Wrote {count} rows to {args.output}")
+        else:
+            for path in args.files:
+                print(f"{path}: {ledger.import_file(path, args.quarter)} rows")
+    except ValueError as e:
+        parser.error(str(e))
+
+if __name__ == "__main__":
+    main()
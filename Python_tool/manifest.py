@@ -0,0 +1,86 @@
+import json
+
+from extraction import check_engine, extractor_fingerprint, source_key, source_stamp
+from extraction_cache import file_digest
+from fields import quarter_number
+from storage import open_database, transaction
+
+class QuarterManifest:
+    """The files behind one quarter's output and the row each produced.
+
+    Every file is recorded with its size, an mtime (or ZIP CRC) stamp and a
+    SHA-256, next to its extracted row. On a re-run a file whose size and
+    stamp are unchanged reuses its row without being read at all; one that
+    was only touched is recognised by its hash. The manifest is rewritten
+    after each run, so deleted files drop out of it. A different extractor,
+    target quarter or text engine starts the manifest over.
+    """
+
+    def __init__(self, path, quarter=None, engine=None):
+        self.path = path
+        self.version = f"{extractor_fingerprint()}/Q{quarter_number(quarter)}/{check_engine(engine)}"
+        open_database(path)
+
+        with transaction(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                " key TEXT PRIMARY KEY, size INTEGER NOT NULL, stamp TEXT NOT NULL,"
+                " digest TEXT NOT NULL, result TEXT NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            row = conn.execute("SELECT value FROM meta WHERE name = 'version'").fetchone()
+            if row is None or row[0] != self.version:
+                conn.execute("DELETE FROM files")
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (self.version,))
+
+    def match(self, indexed):
+        """Split (index, source, deal_name) tasks into reusable rows and the rest.
+
+        Returns ``(hits, entries)``: ``hits`` maps index to the stored row of
+        every unchanged file, ``entries`` maps every index whose key, size and
+        stamp could be read to ``[key, size, stamp, digest]`` (digest None
+        until it is needed) for save().
+        """
+        with transaction(self.path) as conn:
+            known = {key: (size, stamp, digest, result) for key, size, stamp, digest, result
+                     in conn.execute("SELECT key, size, stamp, digest, result FROM files")}
+
+        hits = {}
+        entries = {}
+        for index, source, deal_name in indexed:
+            try:
+                key = source_key(source)
+                size, stamp = source_stamp(source)
+            except (OSError, KeyError):
+                continue  # let extraction report the file
+            entry = [key, size, stamp, None]
+            entries[index] = entry
+            stored = known.get(key)
+            if stored is None or stored[0] != size:
+                continue
+            if stored[1] != stamp:
+                # Same size, new stamp: only a hash tells whether it changed
+                entry[3] = file_digest(source)
+                if entry[3] != stored[2]:
+                    continue
+            entry[3] = stored[2]
+            hits[index] = json.loads(stored[3])
+        return hits, entries
+
+    def save(self, rows):
+        """Replace the manifest with ``rows`` of (source, entry, result)."""
+        rows = list(rows)
+        for source, entry, _ in rows:
+            if entry[3] is None:
+                entry[3] = file_digest(source)
+        with transaction(self.path) as conn:
+            conn.execute("DELETE FROM files")
+            conn.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                [(key, size, stamp, digest, json.dumps(result))
+                 for _, (key, size, stamp, digest), result in rows],
+            )
+
+    def __len__(self):
+        with transaction(self.path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
@@ -0,0 +1,56 @@
+"""Per-file page and memory budgets for extraction workers.
+
+Each page's parsed objects are released as soon as its text is read (see
+extraction._plumber_texts), so a long certificate costs about one page of
+memory at a time. The budgets are a backstop for the rest: a file that
+would read more than PAGE_BUDGET pages, or that takes its worker past
+RSS_BUDGET_MB, is stopped with an error instead of getting the worker
+OOM-killed along with the rest of its chunk.
+"""
+import os
+import resource
+
+# Pages one file may read (0 for no limit)
+PAGE_BUDGET = int(os.environ.get('TDS_PAGE_BUDGET', 0))
+# Resident memory in MB a worker may reach while reading one file (0 for no limit)
+RSS_BUDGET_MB = float(os.environ.get('TDS_RSS_BUDGET_MB', 0))
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def current_rss_mb():
+    """Resident memory of this process right now, in MB."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 2**20
+    except (OSError, IndexError, ValueError):
+        # No /proc (macOS): the peak so far is the closest thing available
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2**20 if os.uname().sysname == 'Darwin' else peak / 1024
+
+class BudgetExceeded(BaseException):
+    """Raised when a file goes over its page or memory budget.
+
+    Derives from BaseException, like FileTimeout, so the blanket
+    ``except Exception`` in process_pdf cannot swallow it.
+    """
+
+class FileBudget:
+    """Tracks one file's pages and the worker's RSS while it is read."""
+
+    def __init__(self, max_pages=None, max_rss_mb=None):
+        self.max_pages = PAGE_BUDGET if max_pages is None else max_pages
+        self.max_rss_mb = RSS_BUDGET_MB if max_rss_mb is None else max_rss_mb
+        self.peak_rss_mb = current_rss_mb()
+
+    def next_page(self, pages_parsed, page_count):
+        # Checked before a page is parsed, so the budget is never overrun
+        if self.max_pages and self.max_pages <= pages_parsed < page_count:
+            raise BudgetExceeded(f"stopped at the page budget of {self.max_pages} of {page_count} pages")
+
+    def after_page(self, pages_parsed):
+        # Called while the page's objects are still alive, so this is the high point
+        rss = current_rss_mb()
+        self.peak_rss_mb = max(self.peak_rss_mb, rss)
+        if self.max_rss_mb and rss > self.max_rss_mb:
+            raise BudgetExceeded(f"went over the memory budget of {self.max_rss_mb:g} MB "
+                                 f"({rss:.0f} MB at page {pages_parsed})")
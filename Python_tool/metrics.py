@@ -0,0 +1,123 @@
+"""Extraction metrics shared by every worker process, in Prometheus text format.
+
+process_pdf times its stages into each file's stats (``timings``, seconds
+per stage); iter_results hands every finished file to a Metrics store,
+which adds the timings to per-stage histograms and counts files processed,
+failed, cached and unchanged. Observations are buffered in memory and
+added to a SQLite file at the end of each batch, so /metrics reports the
+totals of all gunicorn workers, not just the one that answers the scrape.
+"""
+import threading
+
+from storage import open_database, transaction
+
+STAGES = ('zip_extract', 'pdf_open', 'text_extract', 'field_parse', 'csv_write')
+
+# Upper bounds (seconds) of the stage histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+COUNTERS = {
+    'tds_files_processed_total': "PDFs a record was extracted from",
+    'tds_files_failed_total': "PDFs that failed or timed out",
+    'tds_cache_hits_total': "PDFs answered from the extraction cache",
+    'tds_files_unchanged_total': "PDFs reused from a quarter manifest without being read",
+    'tds_files_copies_total': "PDFs skipped as byte-for-byte copies of a certificate already seen",
+    'tds_files_duplicate_total': "Records with the PAN, quarter and amounts of a certificate already seen",
+    'tds_pages_parsed_total': "Pages whose text was extracted",
+}
+HISTOGRAM = 'tds_stage_seconds'
+
+def _bucket(seconds):
+    for bound in BUCKETS:
+        if seconds <= bound:
+            return repr(float(bound))
+    return '+Inf'
+
+def _number(value):
+    """A sample value written out in full: counts as integers, sums as repr(float)."""
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+def add_timings(total, timings):
+    """Add one file's stage ``timings`` into the ``total`` dict; return it."""
+    for stage, seconds in (timings or {}).items():
+        total[stage] = total.get(stage, 0.0) + seconds
+    return total
+
+class Metrics:
+    def __init__(self, path):
+        self.path = path
+        self._pending = {}
+        self._lock = threading.Lock()
+        open_database(path)
+        with transaction(path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS samples ("
+                " name TEXT NOT NULL, stage TEXT NOT NULL, le TEXT NOT NULL, value REAL NOT NULL,"
+                " PRIMARY KEY (name, stage, le))"
+            )
+
+    def _add(self, key, amount):
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + amount
+
+    def count(self, name, amount=1):
+        self._add((name, '', ''), amount)
+
+    def observe(self, stage, seconds):
+        self._add((HISTOGRAM, stage, _bucket(seconds)), 1)
+        self._add((HISTOGRAM, stage, 'sum'), seconds)
+        self._add((HISTOGRAM, stage, 'count'), 1)
+
+    def record(self, result, error, stats):
+        """Count one finished file from iter_results and observe its stage timings."""
+        if stats.get('unchanged'):
+            self.count('tds_files_unchanged_total')
+        elif stats.get('cached'):
+            self.count('tds_cache_hits_total')
+        if stats.get('copy_of'):
+            self.count('tds_files_copies_total')
+        else:
+            self.count('tds_files_processed_total' if result else 'tds_files_failed_total')
+        if stats.get('duplicate_of'):
+            self.count('tds_files_duplicate_total')
+        self.count('tds_pages_parsed_total', stats.get('pages_parsed') or 0)
+        for stage, seconds in (stats.get('timings') or {}).items():
+            self.observe(stage, seconds)
+
+    def flush(self):
+        """Add everything observed since the last flush to the shared totals."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        with transaction(self.path) as conn:
+            conn.executemany(
+                "INSERT INTO samples VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (name, stage, le) DO UPDATE SET value = value + excluded.value",
+                [(*key, value) for key, value in pending.items()],
+            )
+
+    def render(self):
+        """The totals in the Prometheus text exposition format."""
+        self.flush()
+        with transaction(self.path) as conn:
+            samples = {(name, stage, le): value
+                       for name, stage, le, value in conn.execute("SELECT * FROM samples")}
+
+        lines = []
+        for name, help_text in COUNTERS.items():
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter",
+                      f"{name} {_number(samples.get((name, '', ''), 0))}"]
+
+        lines += [f"# HELP {HISTOGRAM} Time spent in each extraction stage per file",
+                  f"# TYPE {HISTOGRAM} histogram"]
+        for stage in STAGES:
+            cumulative = 0
+            for le in [repr(float(bound)) for bound in BUCKETS] + ['+Inf']:
+                cumulative += samples.get((HISTOGRAM, stage, le), 0)
+                lines.append(f'{HISTOGRAM}_bucket{{stage="{stage}",le="{le}"}} {_number(cumulative)}')
+            total, count = (samples.get((HISTOGRAM, stage, le), 0) for le in ("sum", "count"))
+            lines.append(f'{HISTOGRAM}_sum{{stage="{stage}"}} {float(total)!r}')
+            lines.append(f'{HISTOGRAM}_count{{stage="{stage}"}} {_number(count)}')
+        return "\n".join(lines) + "\n"
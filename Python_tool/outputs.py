@@ -0,0 +1,236 @@
+"""Writers for the extracted records in each downloadable format.
+
+Records are buffered and written out a row group at a time, so an output
+file grows while extraction runs instead of being built from one big
+DataFrame at the end. CSV is written with the csv module, so writing it
+never needs pandas; pandas and the libraries behind Parquet, zstd and
+Excel are only imported when they are used.
+"""
+import csv
+import gzip
+import io
+import itertools
+import os
+from collections import namedtuple
+
+# Records buffered before a row group is written
+ROW_GROUP_SIZE = int(os.environ.get('TDS_ROW_GROUP_SIZE', 10000))
+
+COLUMNS = [
+    "PAN of deductee",
+    "Total Amount paid",
+    "Total TDS",
+    "Name of deal",
+    "Total Amount paid confidence",
+    "Total TDS confidence",
+]
+AMOUNT_COLUMNS = ("Total Amount paid", "Total TDS")
+# Few distinct values repeated on every row
+DICTIONARY_COLUMNS = ("Name of deal", "Total Amount paid confidence", "Total TDS confidence")
+
+OutputFormat = namedtuple('OutputFormat', ['extension', 'mimetype', 'module'])
+
+FORMATS = {
+    'csv': OutputFormat('.csv', 'text/csv', None),
+    'csv.gz': OutputFormat('.csv.gz', 'application/gzip', None),
+    'csv.zst': OutputFormat('.csv.zst', 'application/zstd', 'zstandard'),
+    'parquet': OutputFormat('.parquet', 'application/vnd.apache.parquet', 'pyarrow'),
+    'xlsx': OutputFormat('.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'openpyxl'),
+}
+
+class UnsupportedFormat(Exception):
+    pass
+
+def check_format(name):
+    """Return the OutputFormat for ``name``; raise UnsupportedFormat if it can't be written here."""
+    fmt = FORMATS.get(name)
+    if fmt is None:
+        raise UnsupportedFormat(f"Unknown output format '{name}', choose one of: {', '.join(FORMATS)}")
+    if fmt.module:
+        try:
+            __import__(fmt.module)
+        except ImportError:
+            raise UnsupportedFormat(f"The {name} format needs the '{fmt.module}' package, which is not installed")
+    return fmt
+
+def format_for_path(path):
+    """Format name for an output file name, by its extension (CSV if unknown)."""
+    for name, fmt in sorted(FORMATS.items(), key=lambda item: -len(item[1].extension)):
+        if path.endswith(fmt.extension):
+            return name
+    return 'csv'
+
+def split_filename(filename):
+    """(stem, format name) of an output file name."""
+    name = format_for_path(filename)
+    extension = FORMATS[name].extension
+    stem = filename[:-len(extension)] if filename.endswith(extension) else filename
+    return stem, name
+
+def output_filename(stem, name):
+    return stem + FORMATS[name].extension
+
+def _cell(value):
+    # Missing values (None, or NaN out of pandas) are left empty, as pandas writes them
+    return None if value is None or value != value else value
+
+def _rows(records):
+    return [[_cell(record.get(column)) for column in COLUMNS] for record in records]
+
+class RecordWriter:
+    """Buffer records and hand them to ``_write_group`` a row group at a time."""
+
+    def __init__(self, path, row_group_size=ROW_GROUP_SIZE):
+        self.path = path
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self._buffer = []
+
+    def write(self, record):
+        self._buffer.append(record)
+        if len(self._buffer) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._write_group(self._buffer)
+            self.rows += len(self._buffer)
+            self._buffer = []
+
+    def close(self):
+        self.flush()
+        self._finish()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write_group(self, records):
+        raise NotImplementedError
+
+    def _finish(self):
+        pass
+
+class CsvWriter(RecordWriter):
+    def __init__(self, path, compression=None, **options):
+        super().__init__(path, **options)
+        if compression == 'gzip':
+            self._handle = gzip.open(path, 'wt', newline='', encoding='utf-8')
+        elif compression == 'zstd':
+            import zstandard
+            raw = zstandard.ZstdCompressor().stream_writer(open(path, 'wb'))
+            self._handle = io.TextIOWrapper(raw, newline='', encoding='utf-8')
+        else:
+            self._handle = open(path, 'w', newline='', encoding='utf-8')
+        # Same dialect as DataFrame.to_csv, so files read back the same either way
+        self._writer = csv.writer(self._handle, lineterminator='\n')
+        self._writer.writerow(COLUMNS)
+
+    def _write_group(self, records):
+        self._writer.writerows(_rows(records))
+
+    def _finish(self):
+        self._handle.close()
+
+class ParquetWriter(RecordWriter):
+    def __init__(self, path, **options):
+        super().__init__(path, **options)
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        fields = []
+        for column in COLUMNS:
+            if column in AMOUNT_COLUMNS:
+                fields.append(pa.field(column, pa.float64()))
+            elif column in DICTIONARY_COLUMNS:
+                fields.append(pa.field(column, pa.dictionary(pa.int32(), pa.string())))
+            else:
+                fields.append(pa.field(column, pa.string()))
+        self._schema = pa.schema(fields)
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def _write_group(self, records):
+        columns = list(zip(*_rows(records)))
+        arrays = []
+        for column, values, field in zip(COLUMNS, columns, self._schema):
+            if column in AMOUNT_COLUMNS:
+                values = [None if value is None else float(value) for value in values]
+            arrays.append(self._pa.array(values, type=field.type))
+        self._writer.write_table(self._pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def _finish(self):
+        self._writer.close()
+
+class ExcelWriter(RecordWriter):
+    def __init__(self, path, **options):
+        super().__init__(path, **options)
+        from openpyxl import Workbook
+        # Write-only workbooks keep just the current row in memory
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet("TDS")
+        self._sheet.append(COLUMNS)
+
+    def _write_group(self, records):
+        for row in _rows(records):
+            self._sheet.append(row)
+
+    def _finish(self):
+        self._workbook.save(self.path)
+
+def open_writer(path, name, **options):
+    """RecordWriter for format ``name``, writing to ``path``."""
+    check_format(name)
+    if name == 'parquet':
+        return ParquetWriter(path, **options)
+    if name == 'xlsx':
+        return ExcelWriter(path, **options)
+    compression = {'csv.gz': 'gzip', 'csv.zst': 'zstd'}.get(name)
+    return CsvWriter(path, compression=compression, **options)
+
+def read_groups(path, row_group_size=ROW_GROUP_SIZE):
+    """Yield DataFrames of the records in an output file, a row group at a time."""
+    import pandas as pd
+    name = format_for_path(path)
+    check_format(name)
+    if name == 'parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=row_group_size):
+            yield batch.to_pandas()
+    elif name == 'xlsx':
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+        columns = list(next(rows))
+        group = []
+        for row in rows:
+            group.append(row)
+            if len(group) >= row_group_size:
+                yield pd.DataFrame(group, columns=columns)
+                group = []
+        if group:
+            yield pd.DataFrame(group, columns=columns)
+        workbook.close()
+    elif name == 'csv.zst':
+        import zstandard
+        with open(path, 'rb') as raw, zstandard.ZstdDecompressor().stream_reader(raw) as stream:
+            yield from pd.read_csv(stream, chunksize=row_group_size)
+    else:
+        yield from pd.read_csv(path, chunksize=row_group_size)
+
+def convert(source_path, target_path, name, **options):
+    """Rewrite a file of extracted records in another format, one row group at a time.
+
+    Raises UnsupportedFormat for any other file (e.g. a validation
+    report), whose columns the record writers would not keep.
+    """
+    groups = read_groups(source_path, **options)
+    first = next(groups, None)
+    if first is not None and list(first.columns) != COLUMNS:
+        raise UnsupportedFormat(f"Only extracted records can be converted, not {os.path.basename(source_path)}")
+    with open_writer(target_path, name, **options) as writer:
+        for df in itertools.chain([first] if first is not None else [], groups):
+            for record in df.to_dict('records'):
+                writer.write(record)
+    return target_path
@@ -1,81 +1,48 @@
-import pdfplumber
-import pandas as pd
 import os
-import re
+from dedup import DedupIndex
+from extraction import BatchStores, process_directory
+from ledger import Ledger, certificate_key
+from manifest import QuarterManifest
+from outputs import format_for_path, open_writer
 
-def extract_pan_from_filename(filename):
-    pan_pattern = r"[A-Z]{5}[0-9]{4}[A-Z]"
-    match = re.search(pan_pattern, filename)
-    return match.group(0) if match else None
-
-def extract_total_amount_paid(text):
-    total_pattern = r"Summary of payment[\s\S]*?Total \(Rs\.\)\s+([\d,]+\.\d{2})"
-    match = re.search(total_pattern, text)
-    if match:
-        return float(match.group(1).replace(',', ''))
-    return None
-
-def extract_total_tds(text):
-    tds_pattern = r"Q1\s+\w+\s+([\d,]+\.\d{2})\s+([\d,]+\.\d{2})"
-    match = re.search(tds_pattern, text)
-    if match:
-        return float(match.group(1).replace(',', ''))
+def main(input_dir, output_csv, quarter=None, incremental=False, engine=None, ledger_path=None):
+    # The quarter (e.g. "FY 2024-25 Q3") picks the TDS row to read
+    quarter = quarter or os.path.basename(os.path.normpath(input_dir))
     
-    backup_pattern = r"Total \(Rs\.\)\s+([\d,]+\.\d{2})"
-    matches = re.finditer(backup_pattern, text)
-    total = None
-    for i, m in enumerate(matches):
-        if i == 1:
-            total = float(m.group(1).replace(',', ''))
-            break
-    return total
-
-def process_pdf(pdf_path, deal_name):
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = "".join(page.extract_text() + "\n" for page in pdf.pages if page.extract_text())
-            
-            total_paid = extract_total_amount_paid(text)
-            total_tds = extract_total_tds(text)
-            
-            pan = extract_pan_from_filename(os.path.basename(pdf_path))  # Extract PAN dynamically
-            
-            return {
-                "PAN of deductee": pan,
-                "Total Amount paid": total_paid,
-                "Total TDS": total_tds,
-                "Name of deal": deal_name
-            }
-    except Exception as e:
-        print(f"Error processing {pdf_path}: {str(e)}")
-        return None
-
-def process_directory(base_dir):
-    data = []
-    for deal_folder in os.listdir(base_dir):
-        deal_path = os.path.join(base_dir, deal_folder)
-        if not os.path.isdir(deal_path):
-            continue
-        
-        for filename in os.listdir(deal_path):
-            if filename.endswith('.pdf'):
-                pdf_path = os.path.join(deal_path, filename)
-                result = process_pdf(pdf_path, deal_folder)
-                if result:
-                    data.append(result)
-                    print(f"Processed: {deal_folder} - {filename}")
+    # Incremental runs only extract PDFs added or changed since the last run
+    # into this output; the rest come from the manifest kept next to it
+    manifest = QuarterManifest(output_csv + '.manifest.sqlite3', quarter, engine) if incremental else None
     
-    return data
-
-def main(input_dir, output_csv):
-    data = process_directory(input_dir)
+    # The output format follows the file name: .csv, .csv.gz, .csv.zst, .parquet or .xlsx
+    file_stats = []
+    with open_writer(output_csv, format_for_path(output_csv)) as writer:
+        data, _, errors = process_directory(
+            input_dir, stores=BatchStores(manifest=manifest, dedup=DedupIndex()), quarter=quarter, sink=writer,
+            file_stats=file_stats, engine=engine
+        )
     
     if data:
-        df = pd.DataFrame(data)
-        df.to_csv(output_csv, index=False)
+        if ledger_path:
+            # Also keep the rows in the cross-quarter ledger for later lookups;
+            # a record flagged DUPLICATE is already there under its original
+            rows = ((certificate_key(stats), data[stats["row"] - 1]) for stats in file_stats
+                    if "row" in stats and not stats.get("duplicate_of"))
+            try:
+                print(f"Added {Ledger(ledger_path).append(rows, quarter)} rows to the ledger")
+            except ValueError as e:
+                print(f"Not added to the ledger: {str(e)}")
         print(f"\nData saved to {output_csv}")
         print(f"Total records processed: {len(data)}")
+        if incremental:
+            unchanged = sum(1 for stats in file_stats if stats.get("unchanged"))
+            print(f"Unchanged since the last run: {unchanged}")
+        if errors:
+            print(f"Files skipped: {len(errors)}")
+        duplicates = sum(1 for stats in file_stats if stats.get("duplicate_of"))
+        if duplicates:
+            print(f"Rows with the PAN and amounts of an earlier row: {duplicates}")
     else:
+        os.remove(output_csv)
         print("No data was processed")
 
 if __name__ == "__main__":
@@ -0,0 +1,67 @@
+"""Opt-in cProfile capture for certificates that take far longer than the rest.
+
+When a job asks for it (or TDS_PROFILE is set), every file is run under
+cProfile and the profile of each one slower than PROFILE_THRESHOLD seconds
+is written to the job's folder: ``profile_<deal>_<file>.prof`` for pstats
+or snakeviz, and a ``.txt`` next to it with the file's name, page count,
+size and time above the top of the cumulative listing.
+"""
+import cProfile
+import os
+import pstats
+import re
+from contextlib import contextmanager
+
+# Profile every job, not only those that ask
+PROFILE_ALL = os.environ.get('TDS_PROFILE', '').lower() in ('1', 'true', 'on')
+# Files at least this slow (seconds) keep their profile
+PROFILE_THRESHOLD = float(os.environ.get('TDS_PROFILE_THRESHOLD', 5))
+# How many of the slowest files a job result lists
+SLOWEST_FILES = int(os.environ.get('TDS_SLOWEST_FILES', 10))
+
+PROFILE_PREFIX = 'profile_'
+
+@contextmanager
+def profiling(profiler):
+    """Run the block under ``profiler`` (a cProfile.Profile), or plainly if it is None."""
+    if profiler is None:
+        yield
+        return
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+
+def new_profiler(profile_dir):
+    return cProfile.Profile() if profile_dir else None
+
+def save_profile(profiler, profile_dir, stats):
+    """Write a file's profile and its summary; return the .prof file name."""
+    os.makedirs(profile_dir, exist_ok=True)
+    base = PROFILE_PREFIX + re.sub(r"[^\w.-]+", "_", stats['file'])
+    profiler.dump_stats(os.path.join(profile_dir, base + '.prof'))
+    with open(os.path.join(profile_dir, base + '.txt'), 'w') as f:
+        f.write(f"file: {stats['file']}\n"
+                f"pages: {stats.get('page_count')}\n"
+                f"bytes: {stats.get('bytes')}\n"
+                f"seconds: {stats.get('seconds')}\n\n")
+        pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(40)
+    return base + '.prof'
+
+def slowest_files(file_stats, count=SLOWEST_FILES):
+    """The ``count`` slowest files of a job, slowest first, with their profiles.
+
+    A file whose worker was killed at the hard limit has no profile, but is
+    listed with the time it ran and status "killed".
+    """
+    timed = [stats for stats in file_stats if stats.get('seconds') is not None]
+    timed.sort(key=lambda stats: stats['seconds'], reverse=True)
+    return [{
+        "file": stats['file'],
+        "seconds": stats['seconds'],
+        "page_count": stats.get('page_count'),
+        "bytes": stats.get('bytes'),
+        "profile": stats.get('profile'),
+        "status": "killed" if stats.get('killed') else "failed" if stats.get('failure') else "ok",
+    } for stats in timed[:count]]
@@ -0,0 +1,72 @@
+import os
+import time
+
+from extraction_cache import file_digest
+from storage import open_database, transaction
+
+# Failed batches after which a file is no longer attempted
+QUARANTINE_AFTER = int(os.environ.get('TDS_QUARANTINE_AFTER', 2))
+
+class Quarantine:
+    """SQLite list of PDFs that keep timing out or crashing their worker.
+
+    Files are keyed by the SHA-256 of their bytes, so a certificate stays
+    quarantined however it is renamed or zipped. After ``after`` failed
+    batches iter_results skips the file instead of spending another worker
+    and timeout on it; a later success (e.g. after clearing it by hand)
+    forgets the failures.
+    """
+
+    def __init__(self, path, after=QUARANTINE_AFTER):
+        self.path = path
+        self.after = after
+        open_database(path)
+        with transaction(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS failures ("
+                " digest TEXT PRIMARY KEY, name TEXT NOT NULL, failures INTEGER NOT NULL,"
+                " reason TEXT NOT NULL, last_failed REAL NOT NULL)"
+            )
+
+    def digest(self, source):
+        return file_digest(source)
+
+    def failures(self, digests):
+        """Return {digest: (failures, reason)} for the digests with failures on record."""
+        digests = list(set(digests))
+        found = {}
+        with transaction(self.path) as conn:
+            for start in range(0, len(digests), 500):
+                batch = digests[start:start + 500]
+                marks = ','.join('?' * len(batch))
+                rows = conn.execute(
+                    f"SELECT digest, failures, reason FROM failures WHERE digest IN ({marks})", batch,
+                ).fetchall()
+                found.update((digest, (failures, reason)) for digest, failures, reason in rows)
+        return found
+
+    def blocked(self, failures):
+        """The digests of ``failures`` (as returned above) that are quarantined."""
+        return {digest for digest, (count, _) in failures.items() if count >= self.after}
+
+    def record_failure(self, digest, name, reason):
+        with transaction(self.path) as conn:
+            conn.execute(
+                "INSERT INTO failures VALUES (?, ?, 1, ?, ?)"
+                " ON CONFLICT (digest) DO UPDATE SET failures = failures + 1,"
+                " name = excluded.name, reason = excluded.reason, last_failed = excluded.last_failed",
+                (digest, name, reason, time.time()),
+            )
+
+    def clear(self, digests):
+        with transaction(self.path) as conn:
+            conn.executemany("DELETE FROM failures WHERE digest = ?", [(digest,) for digest in digests])
+
+    def entries(self):
+        """Every file with failures on record, most recent first."""
+        with transaction(self.path) as conn:
+            rows = conn.execute(
+                "SELECT name, failures, reason, last_failed FROM failures ORDER BY last_failed DESC"
+            ).fetchall()
+        return [{"file": name, "failures": failures, "reason": reason, "quarantined": failures >= self.after,
+                 "last_failed": last_failed} for name, failures, reason, last_failed in rows]
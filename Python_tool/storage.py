@@ -0,0 +1,33 @@
+import os
+import sqlite3
+from contextlib import contextmanager
+
+def open_database(path):
+    """Create the folder for a SQLite file and switch it to WAL mode.
+
+    WAL lets gunicorn workers read while another worker is writing.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
+
+@contextmanager
+def transaction(path):
+    """Yield a connection whose statements commit (or roll back) together.
+
+    A short-lived connection per call keeps the stores safe to share between
+    request threads and forked workers.
+    """
+    conn = sqlite3.connect(path, timeout=30)
+    conn.isolation_level = None
+    try:
+        conn.execute("BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
@@ -0,0 +1,132 @@
+"""Supervised worker processes that survive hung and crashing inputs.
+
+A ProcessPoolExecutor can neither stop one stuck task nor outlive a
+worker that dies: a PDF that hangs in native code holds its worker
+forever, and one that segfaults breaks the pool and fails every file
+still queued. Here every worker is a process of our own, fed a chunk of
+items over a pipe, and the supervisor knows which item each worker is
+on and since when. A worker past ``hard_limit`` on one item is killed; a
+worker that dies is noticed. Either way the item it was on is retried by
+itself in a fresh worker (up to ``attempts`` times in all), the rest of
+its chunk goes back on the queue, and the other workers carry on.
+"""
+import multiprocessing
+import os
+import time
+from collections import deque
+from multiprocessing.connection import wait
+
+# Tries a file gets within one batch when its worker crashes or is killed
+MAX_ATTEMPTS = int(os.environ.get('TDS_FILE_ATTEMPTS', 2))
+
+def _worker_main(conn, func):
+    while True:
+        chunk = conn.recv()
+        if chunk is None:
+            return
+        for item in chunk:
+            conn.send(func(item))
+
+class _Worker:
+    def __init__(self, context, func):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, func), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.chunk = deque()
+        self.started = None
+
+    def assign(self, chunk):
+        self.chunk = deque(chunk)
+        self.started = time.monotonic()
+        self.conn.send(list(chunk))
+
+    def stop(self, wait_seconds=0):
+        # Idle workers are asked to exit; anything else is killed outright
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(wait_seconds)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+def supervise(func, items, workers, chunk_size, hard_limit=None, attempts=MAX_ATTEMPTS):
+    """Yield ``(item, value, failure, tries, seconds)`` for every item, in completion order.
+
+    ``value`` is ``func(item)`` as run in a worker process; when the worker
+    crashed or was killed on the item's last try, ``value`` is None and
+    ``failure`` says why. ``seconds`` is how long the last try ran.
+    ``func`` must be a module-level function (or a partial of one).
+    Stopping the generator early kills the workers.
+    """
+    context = multiprocessing.get_context()
+    queue = deque(items[start:start + chunk_size] for start in range(0, len(items), chunk_size))
+    tries = {}
+    idle = []
+    busy = []
+    total = len(queue)
+
+    def lost(worker, reason):
+        # The worker is gone; retry its current item alone and requeue the rest
+        busy.remove(worker)
+        worker.stop()
+        item = worker.chunk.popleft()
+        seconds = time.monotonic() - worker.started
+        if worker.chunk:
+            queue.appendleft(list(worker.chunk))
+        tries[id(item)] = tries.get(id(item), 1) + 1
+        if tries[id(item)] <= attempts:
+            queue.appendleft([item])
+            return None
+        return item, None, reason, attempts, seconds
+
+    try:
+        while queue or busy:
+            while queue and (idle or len(busy) < min(workers, total)):
+                worker = idle.pop() if idle else None
+                if worker is None or not worker.process.is_alive():
+                    if worker is not None:
+                        worker.stop()
+                    worker = _Worker(context, func)
+                worker.assign(queue.popleft())
+                busy.append(worker)
+
+            timeout = None
+            if hard_limit:
+                deadline = min(worker.started for worker in busy) + hard_limit
+                timeout = max(0, deadline - time.monotonic())
+            waiting = [worker.conn for worker in busy] + [worker.process.sentinel for worker in busy]
+            ready = wait(waiting, timeout)
+
+            for worker in list(busy):
+                if worker.conn in ready or worker.process.sentinel in ready:
+                    try:
+                        while worker.conn.poll():
+                            value = worker.conn.recv()
+                            item = worker.chunk.popleft()
+                            now = time.monotonic()
+                            seconds, worker.started = now - worker.started, now
+                            yield item, value, None, tries.get(id(item), 1), seconds
+                    except (EOFError, OSError):
+                        pass
+                    if not worker.chunk:
+                        busy.remove(worker)
+                        idle.append(worker)
+                        continue
+                    if not worker.process.is_alive():
+                        outcome = lost(worker, f"worker crashed (exit code {worker.process.exitcode})")
+                        if outcome:
+                            yield outcome
+                        continue
+                if hard_limit and time.monotonic() - worker.started > hard_limit:
+                    outcome = lost(worker, f"killed after {hard_limit:g}s without finishing")
+                    if outcome:
+                        yield outcome
+    finally:
+        for worker in idle:
+            worker.stop(wait_seconds=1)
+        for worker in busy:
+            worker.stop()
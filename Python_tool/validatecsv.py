@@ -1,49 +1,169 @@
-import pandas as pd
-import re
+import csv
+import sys
+
+from fields import PAN_PATTERN
+
+# Rows read per chunk, so files larger than memory can still be validated
+DEFAULT_CHUNKSIZE = 100000
+
+# Error code -> message, in the order the checks are reported
+ERROR_MESSAGES = {
+    "INVALID_PAN": "Invalid PAN format",
+    "MISSING_AMOUNT": "Missing total paid or total TDS",
+    "NEGATIVE_AMOUNT": "Negative values found",
+    "TDS_EXCEEDS_PAID": "TDS cannot be greater than total amount paid",
+    # Only set during extraction with a dedup index, never by validate_frame
+    "DUPLICATE": "Same PAN, quarter and amounts as another certificate",
+    "COPY": "Byte-for-byte copy of another certificate, not extracted",
+}
+
+ERROR_COLUMNS = ["Row", "PAN of deductee", "Code", "Message"]
+# Columns of the report of a /process run, which also name the source
+# and, for DUPLICATE and COPY, the certificate it repeats
+REPORT_COLUMNS = ERROR_COLUMNS + ["Name of deal", "File", "Duplicate of"]
 
 def is_valid_pan(pan):
     """Check if PAN is in a valid format (5 letters, 4 digits, 1 letter)."""
-    pan_pattern = r"^[A-Z]{5}[0-9]{4}[A-Z]$"
-    return bool(re.match(pan_pattern, str(pan)))
-
-def validate_csv(csv_file):
-    df = pd.read_csv(csv_file)
-    
-    errors = []
-    
-    for index, row in df.iterrows():
-        pan = row.get("PAN of deductee", "")
-        total_paid = row.get("Total Amount paid", 0)
-        total_tds = row.get("Total TDS", 0)
-        
-        row_errors = []
-        
-        # Check PAN format
-        if not is_valid_pan(pan):
-            row_errors.append("Invalid PAN format")
-        
-        # Check for missing values
-        if pd.isna(total_paid) or pd.isna(total_tds):
-            row_errors.append("Missing total paid or total TDS")
-        
-        # Check for negative values
-        if total_paid < 0 or total_tds < 0:
-            row_errors.append("Negative values found")
-        
-        # Check logical consistency
-        if total_tds > total_paid:
-            row_errors.append("TDS cannot be greater than total amount paid")
-        
-        if row_errors:
-            errors.append({"Row": index + 1, "Errors": row_errors})
-    
-    if errors:
-        print("Validation Errors Found:")
-        for error in errors:
-            print(f"Row {error['Row']}: {', '.join(error['Errors'])}")
-    else:
+    return bool(PAN_PATTERN.fullmatch(str(pan)))
+
+def _amount(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if value != value else value  # NaN counts as missing
+
+def validate_record(record):
+    """Error codes for a single extracted record, in ERROR_MESSAGES order.
+
+    Applies the same rules as validate_frame to one dict as it comes out of
+    the extractor, so a batch can be checked while it is still running.
+    Needs no pandas, which the frame functions only import when called.
+    """
+    pan = record.get("PAN of deductee")
+    total_paid = _amount(record.get("Total Amount paid", 0))
+    total_tds = _amount(record.get("Total TDS", 0))
+
+    codes = []
+    if pan is None or not is_valid_pan(pan):
+        codes.append("INVALID_PAN")
+    if total_paid is None or total_tds is None:
+        codes.append("MISSING_AMOUNT")
+    if (total_paid is not None and total_paid < 0) or (total_tds is not None and total_tds < 0):
+        codes.append("NEGATIVE_AMOUNT")
+    if total_paid is not None and total_tds is not None and total_tds > total_paid:
+        codes.append("TDS_EXCEEDS_PAID")
+    return codes
+
+def _column(df, name, default):
+    import pandas as pd
+    if name in df:
+        return df[name]
+    return pd.Series(default, index=df.index)
+
+def validate_frame(df, row_offset=0):
+    """Check every row of ``df`` at once; return one error row per failed check.
+
+    Rows are numbered from 1 (plus ``row_offset``), as in the CSV's data
+    rows. The result has the columns in ERROR_COLUMNS and is empty when the
+    data is valid.
+    """
+    import pandas as pd
+    pan = _column(df, "PAN of deductee", None)
+    total_paid = pd.to_numeric(_column(df, "Total Amount paid", 0), errors='coerce')
+    total_tds = pd.to_numeric(_column(df, "Total TDS", 0), errors='coerce')
+
+    checks = {
+        "INVALID_PAN": ~pan.astype("string").str.fullmatch(PAN_PATTERN.pattern).fillna(False).astype(bool),
+        "MISSING_AMOUNT": total_paid.isna() | total_tds.isna(),
+        "NEGATIVE_AMOUNT": (total_paid < 0) | (total_tds < 0),
+        "TDS_EXCEEDS_PAID": total_tds > total_paid,
+    }
+
+    rows = pd.Series(range(row_offset + 1, row_offset + len(df) + 1), index=df.index)
+    frames = []
+    for code, failed in checks.items():
+        if failed.any():
+            frames.append(pd.DataFrame({
+                "Row": rows[failed],
+                "PAN of deductee": pan[failed],
+                "Code": code,
+                "Message": ERROR_MESSAGES[code],
+            }))
+    if not frames:
+        return pd.DataFrame(columns=ERROR_COLUMNS)
+
+    order = {code: i for i, code in enumerate(ERROR_MESSAGES)}
+    errors = pd.concat(frames, ignore_index=True)
+    errors = errors.sort_values(["Row", "Code"], key=lambda col: col.map(order) if col.name == "Code" else col)
+    return errors.reset_index(drop=True)
+
+def validate_csv(csv_file, chunksize=DEFAULT_CHUNKSIZE):
+    """Validate a CSV chunk by chunk and return the combined error frame."""
+    import pandas as pd
+    frames = []
+    row_offset = 0
+    for chunk in pd.read_csv(csv_file, chunksize=chunksize):
+        frames.append(validate_frame(chunk, row_offset=row_offset))
+        row_offset += len(chunk)
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame(columns=ERROR_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+class ReportWriter:
+    """Write the validation report of a /process run as its records are written.
+
+    Takes each record with its stats, as process_files passes them to
+    ``on_record`` when run with ``validate=validate_record``, so the
+    records never have to be kept for the report. Each error is one row in
+    REPORT_COLUMNS, numbered as the record's row in the output file.
+    Files skipped as byte-for-byte copies are added with write_copy().
+    ``error_counts`` and ``invalid_rows`` are counted along the way.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.error_counts = dict.fromkeys(ERROR_MESSAGES, 0)
+        self.invalid_rows = 0
+        self._handle = open(path, 'w', newline='', encoding='utf-8')
+        self._writer = csv.writer(self._handle, lineterminator='\n')
+        self._writer.writerow(REPORT_COLUMNS)
+
+    def write(self, record, stats):
+        codes = stats.get("validation") or ()
+        if codes:
+            self.invalid_rows += 1
+        for code in codes:
+            self.error_counts[code] += 1
+            self._writer.writerow([stats["row"], record.get("PAN of deductee"), code, ERROR_MESSAGES[code],
+                                   record.get("Name of deal"), stats["file"],
+                                   stats.get("duplicate_of") if code == "DUPLICATE" else None])
+
+    def write_copy(self, stats):
+        """Name a file skipped as a copy, and the file it copies; it has no row."""
+        self.error_counts["COPY"] += 1
+        deal = stats["file"].rpartition("/")[0]
+        self._writer.writerow([None, None, "COPY", ERROR_MESSAGES["COPY"], deal, stats["file"], stats["copy_of"]])
+
+    def close(self):
+        self._handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def print_report(errors):
+    if errors.empty:
         print("CSV Data is Valid!")
+        return
+
+    print("Validation Errors Found:")
+    for row, messages in errors.groupby("Row", sort=True)["Message"]:
+        print(f"Row {row}: {', '.join(messages)}")
 
 if __name__ == "__main__":
-    csv_path = "/Users/mokshupadhyay/sih/Python_tool/FY 2024-25 Q3.csv"
-    validate_csv(csv_path)
\ No newline at end of file
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else "/Users/mokshupadhyay/sih/Python_tool/FY 2024-25 Q3.csv"
+    print_report(validate_csv(csv_path))
@@ -1,73 +1,41 @@
 from flask import Flask, request, render_template, jsonify, send_file
-import pdfplumber
-import pandas as pd
 import os
-import re
 import shutil
-from pydrive.auth import GoogleAuth
-from pydrive.drive import GoogleDrive
+from drive_ingest import DriveSync, PyDriveClient, folder_id_from_link, ready_batches
+from extraction import find_pdf_files, iter_results
+from outputs import open_writer
 
-def extract_pan_from_filename(filename):
-    pan_pattern = r"[A-Z]{5}[0-9]{4}[A-Z]"
-    match = re.search(pan_pattern, filename)
-    return match.group(0) if match else None
+def drive_client():
+    # Only jobs with a Drive link pay for importing pydrive
+    from pydrive.auth import GoogleAuth
+    from pydrive.drive import GoogleDrive
 
-def extract_total_amount_paid(text):
-    total_pattern = r"Summary of payment[\s\S]*?Total \(Rs\.\)\s+([\d,]+\.\d{2})"
-    match = re.search(total_pattern, text)
-    return float(match.group(1).replace(',', '')) if match else None
-
-def extract_total_tds(text):
-    tds_pattern = r"Q1\s+\w+\s+([\d,]+\.\d{2})\s+([\d,]+\.\d{2})"
-    match = re.search(tds_pattern, text)
-    if match:
-        return float(match.group(1).replace(',', ''))
-    backup_pattern = r"Total \(Rs\.\)\s+([\d,]+\.\d{2})"
-    matches = re.finditer(backup_pattern, text)
-    for i, m in enumerate(matches):
-        if i == 1:
-            return float(m.group(1).replace(',', ''))
-    return None
-
-def process_pdf(pdf_path, deal_name):
-    try:
-        with pdfplumber.open(pdf_path) as pdf:
-            text = "".join(page.extract_text() + "\n" for page in pdf.pages if page.extract_text())
-            return {
-                "PAN of deductee": extract_pan_from_filename(os.path.basename(pdf_path)),
-                "Total Amount paid": extract_total_amount_paid(text),
-                "Total TDS": extract_total_tds(text),
-                "Name of deal": deal_name
-            }
-    except Exception as e:
-        return None
-
-def process_directory(base_dir):
-    data = []
-    for deal_folder in os.listdir(base_dir):
-        deal_path = os.path.join(base_dir, deal_folder)
-        if not os.path.isdir(deal_path):
-            continue
-        for filename in os.listdir(deal_path):
-            if filename.endswith('.pdf'):
-                result = process_pdf(os.path.join(deal_path, filename), deal_folder)
-                if result:
-                    data.append(result)
-    return data
-
-def download_drive_folder(link, local_dir):
     gauth = GoogleAuth()
     gauth.LocalWebserverAuth()
-    drive = GoogleDrive(gauth)
-    folder_id = link.split("id=")[-1]
-    file_list = drive.ListFile({'q': f"'{folder_id}' in parents and trashed=false"}).GetList()
-    os.makedirs(local_dir, exist_ok=True)
-    for file in file_list:
-        file.GetContentFile(os.path.join(local_dir, file['title']))
+    return PyDriveClient(GoogleDrive(gauth))
+
+def extract_drive_folder(client, link, local_dir):
+    """Mirror a Drive folder into ``local_dir``, extracting files as they land.
+
+    Deal folders are followed recursively, files unchanged since the last
+    sync are not downloaded again, and each batch of finished downloads is
+    extracted while the next one is still coming in. Returns
+    ({path: result or None}, errors) for every PDF currently in the folder.
+    """
+    sync = DriveSync(client, folder_id_from_link(link), local_dir).start()
+    results = {}
+    errors = []
+    for batch in ready_batches(sync):
+        for (result, error, _), (path, _) in zip(iter_results(batch), batch):
+            results[path] = result
+            if error:
+                errors.append(error)
+    return results, sync.errors + errors
 
 def save_data_to_csv(data, output_csv):
-    df = pd.DataFrame(data)
-    df.to_csv(output_csv, index=False)
+    with open_writer(output_csv, 'csv') as writer:
+        for record in data:
+            writer.write(record)
     return output_csv
 
 app = Flask(__name__)
@@ -85,11 +53,23 @@ def index():
                 uploaded_file.save(zip_path)
                 shutil.unpack_archive(zip_path, upload_folder)
         
+        results = {}
+        drive_root = os.path.join(upload_folder, 'drive')
         if 'drive_link' in request.form and request.form['drive_link']:
-            download_drive_folder(request.form['drive_link'], upload_folder)
+            # Kept between requests so a rerun only fetches what changed
+            link = request.form['drive_link']
+            results, _ = extract_drive_folder(drive_client(), link, os.path.join(drive_root, folder_id_from_link(link)))
+        
+        # Everything else in the folder (the unpacked ZIP) is extracted now;
+        # Drive files that are no longer in the shared folder are left out
+        tasks = [(path, deal_name) for path, deal_name in find_pdf_files(upload_folder)
+                 if path in results or not path.startswith(drive_root + os.sep)]
+        remaining = [task for task in tasks if task[0] not in results]
+        for (result, _, _), (path, _) in zip(iter_results(remaining), remaining):
+            results[path] = result
+        data = [results[path] for path, _ in tasks if results[path]]
         
         output_csv = 'output.csv'
-        data = process_directory(upload_folder)
         save_data_to_csv(data, output_csv)
         return send_file(output_csv, as_attachment=True)
     
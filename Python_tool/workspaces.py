@@ -0,0 +1,152 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+# Folder every workspace is created under
+DEFAULT_ROOT = os.environ.get('TDS_WORKSPACE_ROOT', os.path.join(tempfile.gettempdir(), 'tds-workspaces'))
+# Idle time after which a workspace is deleted
+DEFAULT_TTL = float(os.environ.get('TDS_WORKSPACE_TTL_HOURS', 6)) * 3600
+# Bytes all workspaces together may hold
+DEFAULT_QUOTA_BYTES = int(float(os.environ.get('TDS_WORKSPACE_QUOTA_MB', 2048)) * 1024 * 1024)
+# Seconds between the janitor's sweeps for idle workspaces
+JANITOR_INTERVAL = float(os.environ.get('TDS_JANITOR_INTERVAL', 300))
+# Seconds the running byte count is trusted before the root is walked again
+USAGE_REFRESH = float(os.environ.get('TDS_WORKSPACE_USAGE_REFRESH', 60))
+
+_WORKSPACE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+class WorkspaceQuotaExceeded(Exception):
+    pass
+
+class WorkspaceManager:
+    """Private upload/output folders, one per upload, under a shared root.
+
+    Every upload gets its own workspace, so concurrent users (and gunicorn
+    workers) never delete or overwrite each other's files. Workspaces idle
+    for longer than ``ttl`` seconds are reclaimed by a background janitor,
+    and new uploads are refused once all workspaces together would exceed
+    ``quota_bytes``. The quota is checked against a running byte count,
+    re-counted from disk every ``usage_refresh`` seconds, so checking each
+    uploaded chunk doesn't walk every workspace.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT, ttl=DEFAULT_TTL, quota_bytes=DEFAULT_QUOTA_BYTES,
+                 usage_refresh=USAGE_REFRESH):
+        self.root = root
+        self.ttl = ttl
+        self.quota_bytes = quota_bytes
+        self.usage_refresh = usage_refresh
+        self._janitor = None
+        self._janitor_lock = threading.Lock()
+        self._used = None
+        self._used_at = 0
+        self._usage_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def create(self, incoming_bytes=0):
+        """Make a new workspace with room for ``incoming_bytes``; return its id."""
+        self.ensure_capacity(incoming_bytes)
+        workspace_id = uuid.uuid4().hex
+        os.makedirs(self.upload_dir(workspace_id))
+        os.makedirs(self.output_dir(workspace_id))
+        return workspace_id
+
+    def path(self, workspace_id):
+        """Folder of an existing workspace, or None for an unknown/invalid id."""
+        if not workspace_id or not _WORKSPACE_ID.match(workspace_id):
+            return None
+        path = os.path.join(self.root, workspace_id)
+        return path if os.path.isdir(path) else None
+
+    def upload_dir(self, workspace_id):
+        return os.path.join(self.root, workspace_id, 'uploads')
+
+    def output_dir(self, workspace_id):
+        return os.path.join(self.root, workspace_id, 'output')
+
+    def touch(self, workspace_id):
+        """Mark a workspace as in use so the janitor leaves it alone."""
+        path = self.path(workspace_id)
+        if path:
+            os.utime(path)
+
+    def delete(self, workspace_id):
+        path = self.path(workspace_id)
+        if path:
+            shutil.rmtree(path, ignore_errors=True)
+            self._used = None
+
+    def total_bytes(self):
+        total = 0
+        for root, dirs, files in os.walk(self.root):
+            for f in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, f))
+                except OSError:
+                    pass  # removed while we were counting
+        return total
+
+    def _used_bytes(self):
+        # Other processes write to the same root, so the count is only a
+        # running estimate between walks
+        if self._used is None or time.monotonic() - self._used_at > self.usage_refresh:
+            self._used, self._used_at = self.total_bytes(), time.monotonic()
+        return self._used
+
+    def ensure_capacity(self, incoming_bytes):
+        """Raise WorkspaceQuotaExceeded unless ``incoming_bytes`` more fit.
+
+        Bytes that fit are added to the running count straight away.
+        """
+        if not self.quota_bytes:
+            return
+        with self._usage_lock:
+            if self._used_bytes() + incoming_bytes > self.quota_bytes:
+                # Expired workspaces may not have been collected yet
+                self.reclaim_expired()
+                if self._used_bytes() + incoming_bytes > self.quota_bytes:
+                    raise WorkspaceQuotaExceeded(
+                        "Server storage is full right now, please try again later"
+                    )
+            self._used += incoming_bytes
+
+    def reclaim_expired(self):
+        """Delete workspaces idle for longer than the TTL; return how many."""
+        cutoff = time.time() - self.ttl
+        removed = 0
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                expired = _WORKSPACE_ID.match(name) and os.path.getmtime(path) < cutoff
+            except OSError:
+                continue
+            if expired:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        if removed:
+            self._used = None
+        return removed
+
+    def start_janitor(self, interval=JANITOR_INTERVAL):
+        """Reclaim expired workspaces every ``interval`` seconds in a daemon thread.
+
+        Safe to call on every request: only the first call in a process
+        starts the thread.
+        """
+        with self._janitor_lock:
+            if self._janitor is not None:
+                return
+            self._janitor = threading.Thread(target=self._sweep, args=(interval,), name='tds-janitor', daemon=True)
+            self._janitor.start()
+
+    def _sweep(self, interval):
+        while True:
+            try:
+                self.reclaim_expired()
+            except Exception as e:
+                print(f"Workspace janitor failed: {str(e)}")
+            time.sleep(interval)
@@ -1,17 +1,54 @@
-from flask import Flask, request, render_template, send_file, jsonify
+from flask import Flask, request, render_template, send_file, jsonify, Response, stream_with_context
+import csv
+import io
 import os
 import tempfile
+import time
 import shutil
 from werkzeug.utils import secure_filename
 import json
-from utils.pdf_processor import process_directory
+from utils.pdf_processor import BatchStores, check_engine, find_pdf_files, iter_results, source_name
+from utils.uploads import (
+    CHUNK_BYTES, OffsetMismatch, is_finished, mark_finished, receive_chunk, received_bytes, relative_pdf_path
+)
+# Importable once utils.pdf_processor has put the shared engine on the path
+from dedup import DedupIndex
+from jobs import JobQueue
+from metrics import Metrics, add_timings
+from profiling import PROFILE_ALL, PROFILE_PREFIX, slowest_files
+from quarantine import Quarantine
+from outputs import COLUMNS, open_writer
+from workspaces import WorkspaceManager, WorkspaceQuotaExceeded
 
 app = Flask(__name__)
 
+# Job status lives here; uploads and CSVs go to a private workspace per request
+OUTPUT_FOLDER = os.environ.get('OUTPUT_FOLDER', os.path.join(tempfile.gettempdir(), 'tds-extraction'))
+os.makedirs(OUTPUT_FOLDER, exist_ok=True)
+job_queue = JobQueue(os.path.join(OUTPUT_FOLDER, 'jobs.sqlite3'))
+metrics = Metrics(os.path.join(OUTPUT_FOLDER, 'metrics.sqlite3'))
+quarantine = Quarantine(os.path.join(OUTPUT_FOLDER, 'quarantine.sqlite3'))
+# Certificates seen in any upload, so a copy filed under another deal is caught in later ones too;
+# uploads carry no quarter, so the same PAN and amounts are only a duplicate within one job
+DEDUP_FILE = os.path.join(OUTPUT_FOLDER, 'dedup.sqlite3')
+workspaces = WorkspaceManager()
+
+@app.before_request
+def start_janitor():
+    # On the first request, so a preloading server starts it in each worker
+    workspaces.start_janitor()
+
 # Configure upload settings
 ALLOWED_EXTENSIONS = {'pdf'}
 MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB max upload size
 
+# A job gives up on an upload that sends nothing new for this long (seconds)
+UPLOAD_IDLE_TIMEOUT = float(os.environ.get('TDS_UPLOAD_IDLE_TIMEOUT', 600))
+# How often a job looks for newly completed files
+UPLOAD_POLL_INTERVAL = 1.0
+# Longest list of skipped copies a streamed CSV names in its headers; X-Files-Copies has the count
+COPIES_HEADER_BYTES = 4096
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -21,23 +58,30 @@ def index():
 
 @app.route('/process', methods=['POST'])
 def process_files():
-    # Create temporary directories
-    input_temp = tempfile.mkdtemp()
-    output_temp = tempfile.mkdtemp()
+    # Get the files from the request
+    files = request.files.getlist('files')
+    
+    if not files or len(files) == 0:
+        return jsonify({'error': 'No files uploaded'}), 400
+    try:
+        engine = check_engine(request.values.get('engine'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    timings = request.values.get('timings') in ('1', 'true', 'on')
+    profile = PROFILE_ALL or request.values.get('profile') in ('1', 'true', 'on')
+    
+    try:
+        workspace_id = workspaces.create(request.content_length or 0)
+    except WorkspaceQuotaExceeded as e:
+        return jsonify({'error': str(e)}), 507
+    input_temp = workspaces.upload_dir(workspace_id)
     
     try:
-        # Get the files from the request
-        files = request.files.getlist('files')
-        
-        if not files or len(files) == 0:
-            return jsonify({'error': 'No files uploaded'}), 400
         
         # Save uploaded files to temp directory preserving directory structure
         for file in files:
-            if file.filename and allowed_file(file.filename):
-                # Get the relative path of the file
-                relative_path = file.filename
-                
+            relative_path = relative_pdf_path(file.filename)
+            if relative_path and allowed_file(relative_path):
                 # Create the full path in the temp directory
                 file_path = os.path.join(input_temp, relative_path)
                 
@@ -47,37 +91,284 @@ def process_files():
                 # Save the file
                 file.save(file_path)
         
-        # Process the files
-        output_csv = os.path.join(output_temp, 'tds_data_output.csv')
-        data = process_directory(input_temp)
-        
-        if not data:
-            return jsonify({'error': 'No data could be extracted from the PDFs'}), 400
-            
-        import pandas as pd
-        df = pd.DataFrame(data)
-        df.to_csv(output_csv, index=False)
+        if request.args.get('stream') or request.accept_mimetypes.best == 'text/csv':
+            return stream_csv(workspace_id, engine)
         
-        # Return the CSV file
-        return send_file(
-            output_csv,
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name='tds_data_output.csv'
-        )
+        # Extract in the background; the client polls /jobs/<id>
+        mark_finished(input_temp)
+        job_id = job_queue.submit(run_extraction, workspace_id, engine=engine, timings=timings, profile=profile,
+                                  kind='process')
+        return jsonify({'job_id': job_id, 'status_url': f'/jobs/{job_id}'}), 202
         
     except Exception as e:
+        workspaces.delete(workspace_id)
         return jsonify({'error': str(e)}), 500
+
+def stream_csv(workspace_id, engine=None):
+    """Answer /process with the CSV itself, one row sent per PDF as it is extracted.
+
+    Byte-for-byte copies of certificates seen before have no row; they are
+    found before the response starts, so its headers can name them.
+    """
+    tasks = find_pdf_files(workspaces.upload_dir(workspace_id))
+    dedup = DedupIndex(DEDUP_FILE)
+    copies = []
+    new_tasks = []
+    for source, deal_name in tasks:
+        label = f"{deal_name}/{source_name(source)}"
+        first = dedup.first_copy(dedup.digest(source), label)
+        if first is None:
+            new_tasks.append((source, deal_name))
+            continue
+        copies.append({'file': label, 'copy_of': first})
+        metrics.record(None, None, {'file': label, 'copy_of': first})
+    
+    def rows():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        
+        def take():
+            chunk = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return chunk
+        
+        try:
+            writer.writerow(COLUMNS)
+            yield take()
+            # The copies found above are known to dedup, so only new files are run
+            stores = BatchStores(quarantine=quarantine, dedup=dedup, metrics=metrics)
+            batch = iter_results(new_tasks, stores, engine=engine)
+            for result, error, stats in batch:
+                if result:
+                    start = time.perf_counter()
+                    writer.writerow([result.get(column) for column in COLUMNS])
+                    metrics.observe('csv_write', time.perf_counter() - start)
+                    yield take()
+                elif error:
+                    print(error)
+        finally:
+            # Runs when the response ends, even if the client went away
+            workspaces.delete(workspace_id)
+    
+    return Response(
+        stream_with_context(rows()),
+        mimetype='text/csv',
+        headers={
+            'Content-Disposition': 'attachment; filename=tds_data_output.csv',
+            'X-Files-Total': str(len(tasks)),
+            'X-Files-Copies': str(len(copies)),
+            'X-Copies-Skipped': copies_header(copies),
+        }
+    )
+
+def copies_header(copies):
+    """JSON list of the skipped copies, cut short to fit in a response header."""
+    while True:
+        value = json.dumps(copies)
+        if len(value) <= COPIES_HEADER_BYTES or not copies:
+            return value
+        copies = copies[:len(copies) // 2]
+
+@app.route('/uploads', methods=['POST'])
+def start_upload():
+    """Open a chunked upload; extraction starts as soon as the first file lands."""
+    expected_files = request.form.get('files', type=int) or 0
+    try:
+        engine = check_engine(request.form.get('engine'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    timings = request.form.get('timings') in ('1', 'true', 'on')
+    profile = PROFILE_ALL or request.form.get('profile') in ('1', 'true', 'on')
+    try:
+        workspace_id = workspaces.create(request.form.get('bytes', type=int) or 0)
+    except WorkspaceQuotaExceeded as e:
+        return jsonify({'error': str(e)}), 507
+    
+    job_id = job_queue.submit(run_extraction, workspace_id, expected_files, engine, timings, profile, kind='upload')
+    return jsonify({
+        'upload_id': workspace_id,
+        'job_id': job_id,
+        'status_url': f'/jobs/{job_id}',
+        'chunk_bytes': CHUNK_BYTES
+    }), 201
+
+@app.route('/uploads/<upload_id>/files', methods=['GET', 'PUT'])
+def upload_chunk(upload_id):
+    """GET: how much of ``path`` is stored. PUT: append the raw body at ``offset``."""
+    if workspaces.path(upload_id) is None:
+        return jsonify({'error': 'Unknown or expired upload'}), 404
+    path = relative_pdf_path(request.args.get('path'))
+    if path is None:
+        return jsonify({'error': 'Only PDF files can be uploaded'}), 400
+    upload_dir = workspaces.upload_dir(upload_id)
+    workspaces.touch(upload_id)
+    
+    if request.method == 'GET':
+        received, complete = received_bytes(upload_dir, path)
+        return jsonify({'path': path, 'received': received, 'complete': complete})
+    
+    if is_finished(upload_dir) or not os.path.isdir(upload_dir):
+        return jsonify({'error': 'This upload is already finished'}), 409
+    offset = request.args.get('offset', 0, type=int)
+    size = request.args.get('size', type=int)
+    if size is None:
+        return jsonify({'error': 'Missing the file size'}), 400
+    try:
+        workspaces.ensure_capacity(request.content_length or 0)
+        received, complete = receive_chunk(upload_dir, path, offset, size, request.stream)
+    except WorkspaceQuotaExceeded as e:
+        return jsonify({'error': str(e)}), 507
+    except OffsetMismatch as e:
+        # Tell the client where to resume from
+        return jsonify({'error': str(e), 'path': path, 'received': e.received}), 409
+    return jsonify({'path': path, 'received': received, 'complete': complete})
+
+@app.route('/uploads/<upload_id>/finish', methods=['POST'])
+def finish_upload(upload_id):
+    """No more files are coming; the job finishes once the last one is extracted."""
+    if workspaces.path(upload_id) is None:
+        return jsonify({'error': 'Unknown or expired upload'}), 404
+    mark_finished(workspaces.upload_dir(upload_id))
+    return jsonify({'upload_id': upload_id, 'finished': True})
+
+def run_extraction(progress, workspace_id, expected_files=0, engine=None, timings=False, profile=False):
+    """Background body of a /process or /uploads job; returns the job's result.
+
+    Extracts completed files as they appear in the workspace, batch by
+    batch, until the upload is marked finished and nothing new is left, so
+    extraction overlaps with a chunked upload that is still running. With
+    ``timings`` the result breaks the job's time down by stage. With
+    ``profile`` the slowest files are profiled into the workspace (served
+    by /jobs/<id>/profiles/<name>) and listed under "slowest".
+    """
+    input_temp = workspaces.upload_dir(workspace_id)
+    profile_dir = workspaces.output_dir(workspace_id) if profile else None
+    results = {}
+    errors = []
+    file_stats = []
+    job_timings = {}
+    # Shared by every batch, so a copy is caught whichever batch it lands in
+    dedup = DedupIndex(DEDUP_FILE)
+    stores = BatchStores(quarantine=quarantine, dedup=dedup, metrics=metrics)
+    last_activity = time.time()
+    try:
+        while True:
+            # Check before listing, so files that landed before the marker are seen
+            finished = is_finished(input_temp)
+            tasks = [task for task in find_pdf_files(input_temp) if task[0] not in results]
+            if not tasks:
+                if finished:
+                    break
+                if time.time() - last_activity > UPLOAD_IDLE_TIMEOUT:
+                    raise RuntimeError("The upload stopped before it was finished")
+                # Record where the last batch ended while waiting for more files
+                progress(len(results), max(expected_files, len(results)), errors)
+                time.sleep(UPLOAD_POLL_INTERVAL)
+                continue
+            
+            done_before = len(results)
+            errors_before = list(errors)
+            
+            def batch_progress(files_done, files_total, batch_errors, flagged=()):
+                total = max(expected_files, done_before + files_total)
+                progress(done_before + files_done, total, errors_before + list(batch_errors))
+            
+            batch = iter_results(tasks, stores, progress=batch_progress, engine=engine, profile_dir=profile_dir)
+            for (result, error, stats), (source, _) in zip(batch, tasks):
+                results[source] = result
+                file_stats.append(stats)
+                add_timings(job_timings, stats.get('timings'))
+                if error:
+                    errors.append(error)
+            last_activity = time.time()
+            workspaces.touch(workspace_id)
         
+        # Same row order as a one-shot run over the whole folder
+        data = [results[source] for source, _ in find_pdf_files(input_temp) if results.get(source)]
     finally:
-        # Clean up temp directories
+        # Clean up the uploaded PDFs; the workspace stays for the download
         shutil.rmtree(input_temp, ignore_errors=True)
-        shutil.rmtree(output_temp, ignore_errors=True)
+    workspaces.touch(workspace_id)
+    
+    if not data:
+        return {'success': False, 'error': 'No data could be extracted from the PDFs', 'errors': errors}
+    
+    output_csv = os.path.join(workspaces.output_dir(workspace_id), 'tds_data_output.csv')
+    with open_writer(output_csv, 'csv') as writer:
+        for record in data:
+            start = time.perf_counter()
+            writer.write(record)
+            seconds = time.perf_counter() - start
+            metrics.observe('csv_write', seconds)
+            add_timings(job_timings, {'csv_write': seconds})
+    metrics.flush()
+    
+    result = {'success': True, 'count': len(data), 'errors': errors, 'workspace': workspace_id,
+              'failed': [stats['file'] for stats in file_stats if stats.get('failure')],
+              'quarantined': [stats['file'] for stats in file_stats if stats.get('quarantined')],
+              'copies_skipped': [{'file': stats['file'], 'copy_of': stats['copy_of']}
+                                 for stats in file_stats if stats.get('copy_of')],
+              'duplicates': [{'file': stats['file'], 'duplicate_of': stats['duplicate_of']}
+                             for stats in file_stats if stats.get('duplicate_of')]}
+    if timings:
+        result['timings'] = {stage: round(seconds, 4) for stage, seconds in job_timings.items()}
+    if profile:
+        result['slowest'] = slowest_files(file_stats)
+    return result
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/download', methods=['GET'])
+def download_job(job_id):
+    job = job_queue.get(job_id)
+    workspace_id = job['result'].get('workspace') if job and job['result'] else None
+    if workspaces.path(workspace_id) is None:
+        return jsonify({'error': 'No output available for this job'}), 404
+    
+    # Return the CSV file
+    return send_file(
+        os.path.join(workspaces.output_dir(workspace_id), 'tds_data_output.csv'),
+        mimetype='text/csv',
+        as_attachment=True,
+        download_name='tds_data_output.csv'
+    )
+
+@app.route('/jobs/<job_id>/profiles/<filename>', methods=['GET'])
+def download_profile(job_id, filename):
+    job = job_queue.get(job_id)
+    workspace_id = job['result'].get('workspace') if job and job['result'] else None
+    if workspaces.path(workspace_id) is None or not filename.startswith(PROFILE_PREFIX):
+        return jsonify({'error': 'No such profile for this job'}), 404
+    profile_path = os.path.join(workspaces.output_dir(workspace_id), secure_filename(filename))
+    if not os.path.isfile(profile_path):
+        return jsonify({'error': 'No such profile for this job'}), 404
+    return send_file(
+        profile_path,
+        mimetype='application/octet-stream',
+        as_attachment=True,
+        download_name=filename
+    )
 
 @app.route('/status', methods=['GET'])
 def status():
     # This is a simple endpoint to check if the server is running
     return jsonify({'status': 'ok'})
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    # Extraction metrics for Prometheus to scrape
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/quarantine', methods=['GET'])
+def quarantine_list():
+    # PDFs that timed out or crashed a worker, and whether they are now skipped
+    return jsonify(quarantine.entries())
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5001)
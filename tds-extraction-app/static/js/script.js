@@ -11,6 +11,11 @@ document.addEventListener('DOMContentLoaded', function() {
     const downloadLink = document.getElementById('download-link');
     
     let selectedFiles = [];
+    let uploadedCount = 0;
+    
+    // Files sent at once, and attempts per chunk before giving up
+    const PARALLEL_UPLOADS = 3;
+    const CHUNK_ATTEMPTS = 4;
     
     // Handle file selection
     fileInput.addEventListener('change', function(e) {
@@ -43,46 +48,49 @@ document.addEventListener('DOMContentLoaded', function() {
         statusElement.style.display = 'none';
         resultsContainer.style.display = 'none';
         
-        // Create FormData to send files
-        const formData = new FormData();
-        
-        // Add all selected files with their relative paths
-        for (let file of selectedFiles) {
-            formData.append('files', file, file.webkitRelativePath);
-        }
-        
         try {
-            // Simulate file upload progress
-            let progress = 0;
-            const totalFiles = selectedFiles.length;
-            const progressInterval = setInterval(() => {
-                if (progress < 95) {
-                    progress += 5;
-                    progressBar.style.width = `${progress}%`;
-                    progressText.textContent = `Processing files... (${Math.round(progress)}%)`;
-                }
-            }, 300);
+            progressBar.style.width = '0%';
+            progressText.textContent = 'Uploading files...';
+            uploadedCount = 0;
             
-            // Send files to server
-            const response = await fetch('/process', {
+            // Open a chunked upload; the server extracts each file as soon as it lands
+            const sessionForm = new FormData();
+            sessionForm.append('files', selectedFiles.length);
+            sessionForm.append('bytes', selectedFiles.reduce((total, file) => total + file.size, 0));
+            const response = await fetch('/uploads', {
                 method: 'POST',
-                body: formData
+                body: sessionForm
             });
             
-            // Clear progress interval
-            clearInterval(progressInterval);
-            
+            const started = await response.json();
             if (!response.ok) {
-                const errorData = await response.json();
-                throw new Error(errorData.error || 'Failed to process files');
+                throw new Error(started.error || 'Failed to process files');
+            }
+            
+            // Follow the job's real progress while the files are still uploading
+            const jobDone = pollJob(started.job_id);
+            jobDone.catch(() => {});
+            await uploadFiles(started.upload_id, started.chunk_bytes);
+            const finish = await fetch(`/uploads/${started.upload_id}/finish`, { method: 'POST' });
+            if (!finish.ok) {
+                throw new Error('Failed to finish the upload');
+            }
+            const job = await jobDone;
+            if (!job.result.success) {
+                throw new Error(job.result.error || 'Failed to process files');
             }
             
             // Complete progress bar
             progressBar.style.width = '100%';
             progressText.textContent = 'Processing complete!';
             
+            const download = await fetch(`/jobs/${started.job_id}/download`);
+            if (!download.ok) {
+                throw new Error('Failed to download the CSV file');
+            }
+            
             // Get the blob data for the CSV file
-            const blob = await response.blob();
+            const blob = await download.blob();
             
             // Create a URL for the blob
             const url = window.URL.createObjectURL(blob);
@@ -121,6 +129,95 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
     
+    async function uploadFiles(uploadId, chunkBytes) {
+        let next = 0;
+        async function worker() {
+            while (next < selectedFiles.length) {
+                const file = selectedFiles[next++];
+                await uploadFile(uploadId, file, chunkBytes);
+                uploadedCount++;
+            }
+        }
+        const workers = [];
+        for (let i = 0; i < PARALLEL_UPLOADS; i++) {
+            workers.push(worker());
+        }
+        await Promise.all(workers);
+    }
+    
+    // Send one file in chunks, resuming from what the server already has
+    async function uploadFile(uploadId, file, chunkBytes) {
+        const url = `/uploads/${uploadId}/files?path=${encodeURIComponent(file.webkitRelativePath || file.name)}`;
+        let offset = 0;
+        let failures = 0;
+        while (true) {
+            const end = Math.min(offset + chunkBytes, file.size);
+            try {
+                const response = await fetch(`${url}&offset=${offset}&size=${file.size}`, {
+                    method: 'PUT',
+                    body: file.slice(offset, end)
+                });
+                const state = await response.json();
+                if (response.ok || response.status === 409) {
+                    if (state.received === undefined) {
+                        throw new Error(state.error || `Failed to upload ${file.name}`);
+                    }
+                    if (state.complete || state.received >= file.size) {
+                        return;
+                    }
+                    offset = state.received;
+                    failures = 0;
+                    continue;
+                }
+                throw new Error(state.error || `Failed to upload ${file.name}`);
+            } catch (error) {
+                if (++failures >= CHUNK_ATTEMPTS) {
+                    throw error;
+                }
+                // Ask the server how much arrived, then resume from there
+                await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+                const response = await fetch(url);
+                if (response.ok) {
+                    offset = (await response.json()).received;
+                }
+            }
+        }
+    }
+    
+    async function pollJob(jobId) {
+        while (true) {
+            const response = await fetch(`/jobs/${jobId}`);
+            const job = await response.json();
+            if (!response.ok) {
+                throw new Error(job.error || 'Lost track of the processing job');
+            }
+            
+            if (job.files_total) {
+                const percent = (100 * job.files_done) / job.files_total;
+                progressBar.style.width = `${percent}%`;
+                let text = `Processing files... ${job.files_done}/${job.files_total}`;
+                if (uploadedCount < job.files_total) {
+                    text += `, uploaded ${uploadedCount}`;
+                }
+                if (job.error_count) {
+                    text += `, ${job.error_count} failed`;
+                }
+                if (job.eta_seconds != null) {
+                    text += ` (about ${Math.ceil(job.eta_seconds)}s left)`;
+                }
+                progressText.textContent = text;
+            }
+            
+            if (job.status === 'done') {
+                return job;
+            }
+            if (job.status === 'failed') {
+                throw new Error(job.error || 'Failed to process files');
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000));
+        }
+    }
+    
     function showStatus(message, type) {
         statusElement.textContent = message;
         statusElement.className = `status ${type}`;
@@ -0,0 +1,82 @@
+import os
+
+# Bytes per chunk the page sends; each chunk is its own request
+CHUNK_BYTES = int(float(os.environ.get('TDS_UPLOAD_CHUNK_MB', 8)) * 1024 * 1024)
+
+PART_SUFFIX = '.part'
+# Written into the upload folder once the client has sent every file
+FINISHED_MARKER = '.finished'
+
+class OffsetMismatch(Exception):
+    """A chunk did not start where the stored part of its file ends."""
+
+    def __init__(self, received):
+        super().__init__(f"Expected a chunk starting at byte {received}")
+        self.received = received
+
+def relative_pdf_path(name):
+    """Sanitised relative path for an uploaded PDF, or None if it isn't one."""
+    # Folder names are kept as typed: the deal name is read from them
+    parts = [part for part in (name or '').replace('\\', '/').split('/')]
+    parts = [part for part in parts if part and part != '.']
+    if not parts or '..' in parts or any('\0' in part for part in parts):
+        return None
+    if not parts[-1].lower().endswith('.pdf'):
+        return None
+    return os.path.join(*parts)
+
+def received_bytes(upload_dir, path):
+    """(bytes stored so far, whether the file is complete) for one upload."""
+    target = os.path.join(upload_dir, path)
+    if os.path.exists(target):
+        return os.path.getsize(target), True
+    try:
+        return os.path.getsize(target + PART_SUFFIX), False
+    except OSError:
+        return 0, False
+
+def receive_chunk(upload_dir, path, offset, size, stream, block_size=1024 * 1024):
+    """Write a chunk starting at ``offset`` into a file of ``size`` bytes.
+
+    The file is kept as ``<path>.part`` until all ``size`` bytes are in, then
+    renamed into place, which is what makes it visible to extraction. A
+    chunk that doesn't start where the part ends raises OffsetMismatch, so
+    an interrupted client can ask where to resume. The chunk is written at
+    ``offset`` rather than appended, so a retried or concurrent PUT of the
+    same chunk rewrites the same bytes instead of adding them twice.
+    Returns the same tuple as received_bytes.
+    """
+    received, complete = received_bytes(upload_dir, path)
+    if complete:
+        return received, True
+    if offset != received:
+        raise OffsetMismatch(received)
+
+    target = os.path.join(upload_dir, path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd = os.open(target + PART_SUFFIX, os.O_WRONLY | os.O_CREAT, 0o644)
+    try:
+        position = offset
+        for block in iter(lambda: stream.read(block_size), b''):
+            view = memoryview(block)
+            while view:
+                written = os.pwrite(fd, view, position)
+                view = view[written:]
+                position += written
+        received = os.fstat(fd).st_size
+    finally:
+        os.close(fd)
+
+    if received >= size:
+        try:
+            os.replace(target + PART_SUFFIX, target)
+        except FileNotFoundError:
+            pass  # a concurrent PUT of the last chunk renamed it first
+        return received, True
+    return received, False
+
+def mark_finished(upload_dir):
+    open(os.path.join(upload_dir, FINISHED_MARKER), 'w').close()
+
+def is_finished(upload_dir):
+    return os.path.exists(os.path.join(upload_dir, FINISHED_MARKER))